@@ -0,0 +1,93 @@
+""" alg_P.py
+
+    Algorithms to generate all permutations of a list.
+
+    These are used by the rule-based solver (in rules.py) to try the ways of
+    placing a group's values into its squares.
+
+    The functions are named after algorithms 7.2.1.2P and 7.2.1.2L in Donald
+    Knuth's The Art of Computer Programming. Like algorithm_b(), they yield
+    the same list object each time, changing it in place between visits, so
+    each step is fast. Callers that want to keep a permutation should copy it.
+"""
+
+# ______________________________________________________________________
+# Public functions
+
+def algorithm_P(items):
+    """ This is Knuth's Algorithm P, which generates permutations by "plain
+        changes."
+
+        This yields a list that visits every permutation of `items`, where
+        each permutation differs from the last by swapping two adjacent
+        elements. The elements of `items` are treated as distinct even if some
+        are equal; see algorithm_L() for permutations of a multiset.
+    """
+
+    a = list(items)
+    n = len(a)
+
+    if n <= 1:
+        yield a
+        return
+
+    # The comments refer to the steps of Knuth's description, which uses
+    # 1-based indexes; so a_k is a[k - 1] here. c[j] counts how far element j
+    # has moved, and o[j] is the direction it's moving in.
+    c = [0] * (n + 1)
+    o = [1] * (n + 1)
+
+    while True:
+
+        yield a                    # P2. Visit.
+
+        j, s = n, 0                # P3. Prepare for change.
+        while True:
+            q = c[j] + o[j]        # P4. Ready to change?
+            if 0 <= q < j:
+                break
+            if q == j:             # P6. Increase s.
+                if j == 1:
+                    return
+                s += 1
+            o[j] = -o[j]           # P7. Switch direction.
+            j -= 1
+
+        # P5. Change.
+        k, l = j - c[j] + s - 1, j - q + s - 1
+        a[k], a[l] = a[l], a[k]
+        c[j] = q
+
+def algorithm_L(items):
+    """ This is Knuth's Algorithm L, which generates permutations in
+        lexicographic order.
+
+        This yields a list that visits every distinct permutation of `items`
+        exactly once, starting with the sorted order. Equal elements are not
+        told apart, so [2, 2, 3] has only three permutations. The elements
+        must be comparable.
+    """
+
+    a = sorted(items)
+    n = len(a)
+
+    while True:
+
+        yield a                    # L1. Visit.
+
+        j = n - 2                  # L2. Find j.
+        while j >= 0 and a[j] >= a[j + 1]:
+            j -= 1
+        if j < 0:
+            return
+
+        l = n - 1                  # L3. Increase a[j].
+        while a[j] >= a[l]:
+            l -= 1
+        a[j], a[l] = a[l], a[j]
+
+        k, l = j + 1, n - 1        # L4. Reverse a[j + 1:].
+        while k < l:
+            a[k], a[l] = a[l], a[k]
+            k += 1
+            l -= 1
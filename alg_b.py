@@ -6,16 +6,31 @@
     number-partition-finder (in partition.py).
 
     The main function is named algorithm_B() after algorithm 7.2.2B in Donald
-    Knuth's The Art of Computer Programming.
+    Knuth's The Art of Computer Programming. There's also algorithm_e(), after
+    algorithm 7.2.2E, which estimates the size of a backtrack tree without
+    searching all of it.
 """
 
+# ______________________________________________________________________
+# Imports
+
+import random
+
+
 # ______________________________________________________________________
 # Public functions
 
 def pass_(*args):
     pass
 
-def algorithm_b(x, D, is_good, update=pass_, downdate=pass_, ell=0):
+def algorithm_b(
+        x,
+        D,
+        is_good,
+        update=pass_,
+        downdate=pass_,
+        ell=0,
+        choose=None):
     """ This is the basic backtrack algorithm from Knuth's section 7.2.2.
 
         x is a list whose values will be changed as this iterates; x will be the
@@ -30,6 +45,125 @@ def algorithm_b(x, D, is_good, update=pass_, downdate=pass_, ell=0):
         The optional functions update() and downdate() provide callers a
         convenient way to keep track of intermediate helper data structures that
         allow is_good to operate more efficiently.
+
+        If the optional function choose(x, ell) is given, then D is ignored
+        and may be None. Instead, each time we enter level ell, we call
+        choose(x, ell), which returns a pair (i, values): level ell will set
+        x[i] to each of the given values in turn. Each level must choose an
+        index that no earlier level is using. This lets callers pick the next
+        variable and its domain based on the current partial solution; eg, to
+        branch on the variable with the fewest remaining values. In this case,
+        "x[0], ..., x[ell]" above means the entries chosen by the first ell
+        levels, and callers that need to know which index each level chose can
+        record that in choose().
+
+        This version keeps its own stack rather than recursing, so solutions
+        aren't passed up through a chain of nested generators.
+    """
+
+    n = len(x)
+    start = ell
+
+    # Level ell sets x[var[ell]] to each value from the iterator its[ell].
+    var = list(range(n))
+    its = [None] * n
+
+    while True:
+
+        # Enter level ell.
+        if ell == n:
+            yield x
+        elif choose is None:
+            its[ell] = iter(D[ell])
+        else:
+            var[ell], values = choose(x, ell)
+            its[ell] = iter(values)
+
+        # Move to the next good value at level ell, backing up a level each
+        # time we run out of values.
+        while True:
+            is_found = False
+            if ell < n:
+                i = var[ell]
+                for d in its[ell]:
+                    x[i] = d
+                    if is_good(x, ell + 1):
+                        is_found = True
+                        break
+            if is_found:
+                update(x, ell + 1)
+                ell += 1
+                break
+            ell -= 1
+            if ell < start:
+                return
+            downdate(x, ell + 1)
+
+def algorithm_e(
+        x,
+        D,
+        is_good,
+        update=pass_,
+        downdate=pass_,
+        ell=0,
+        choose=None,
+        rng=random):
+    """ This is Knuth's Algorithm E from section 7.2.2, which estimates the
+        size of the tree that algorithm_b() would search, given the same
+        arguments, by following a single random path down the tree.
+
+        At each level, we find every good value, note how many there are, and
+        move down using one of them chosen at random by `rng`. We stop at a
+        dead end or at a solution. If the levels we passed through had
+        d_1, d_2, ... good values, then the tree holds about
+        1 + d_1 + d_1 d_2 + ... nodes.
+
+        This returns the pair (num_nodes, num_solns), where num_nodes is the
+        estimate above, and num_solns is the product of all the d values if
+        we reached a solution, or 0 if we hit a dead end. Both estimates are
+        unbiased; ie, their averages over many probes approach the true
+        counts. They can vary a lot from probe to probe, so it's best to
+        average many of them.
+
+        When this returns, update() and downdate() have been called in pairs,
+        so any helper data is back to where it started.
+    """
+
+    n = len(x)
+    start = ell
+
+    weight = 1
+    num_nodes = 1
+
+    while ell < n:
+        if choose is None:
+            i, values = ell, D[ell]
+        else:
+            i, values = choose(x, ell)
+        good_values = []
+        for d in values:
+            x[i] = d
+            if is_good(x, ell + 1):
+                good_values.append(d)
+        if not good_values:
+            break
+        weight *= len(good_values)
+        num_nodes += weight
+        x[i] = rng.choice(good_values)
+        update(x, ell + 1)
+        ell += 1
+
+    num_solns = weight if ell == n else 0
+
+    for level in range(ell, start, -1):
+        downdate(x, level)
+
+    return num_nodes, num_solns
+
+def recursive_algorithm_b(x, D, is_good, update=pass_, downdate=pass_, ell=0):
+    """ This is the original recursive version of algorithm_b(), without the
+        `choose` option. It's kept as a reference, and so that bench.py can
+        compare the two.
     """
 
     if ell == len(x):
@@ -41,6 +175,8 @@ def algorithm_b(x, D, is_good, update=pass_, downdate=pass_, ell=0):
         ell += 1
         if is_good(x, ell):
             update(x, ell)
-            yield from algorithm_b(x, D, is_good, update, downdate, ell)
+            yield from recursive_algorithm_b(
+                    x, D, is_good, update, downdate, ell
+            )
             downdate(x, ell)
         ell -= 1
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+""" batch_solve.py
+
+    Solve many .kk files without opening the editor.
+
+    Usage:
+
+        ./batch_solve.py [options] <file|dir|glob> [<file|dir|glob> ...]
+
+    Directories are searched recursively for .kk files, and globs are
+    expanded (quote them to keep your shell from expanding them first). The
+    puzzles are solved across a pool of worker processes, and one JSON object
+    per puzzle is written as soon as that puzzle is done, so the results are
+    in completion order rather than input order. Each JSON object has these
+    keys:
+
+        file           The puzzle's filename.
+        size           The puzzle's size, or null if it couldn't be read.
+        engine         The solver engine used.
+        solution       The first solution found, or null.
+        num_solutions  The number of solutions found, counting up to --limit.
+        limit          The value of --limit.
+        is_complete    False if the time limit stopped the search early.
+        time           Seconds spent solving.
+        nodes          Search nodes visited.
+        error          A description of what went wrong, or null.
+
+    When the batch is done, a summary is printed to stderr.
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import search
+import solver
+from puzzle import Puzzle
+
+
+# ______________________________________________________________________
+# Internal functions
+
+def find_puzzle_files(paths):
+    """ Return the sorted list of .kk files named by `paths`, which may be
+        files, directories, or glob patterns.
+    """
+
+    filenames = set()
+    for path in paths:
+        matches = [path]
+        if glob.has_magic(path):
+            matches = glob.glob(path, recursive=True)
+        for match in matches:
+            if os.path.isdir(match):
+                pattern = os.path.join(match, '**', '*.kk')
+                filenames.update(glob.glob(pattern, recursive=True))
+            else:
+                filenames.add(match)
+    return sorted(filenames)
+
+def solve_file(args):
+    """ This runs in a worker process. It returns the result dict for the
+        puzzle in one file.
+    """
+
+    filename, engine, limit, time_limit = args
+
+    result = {
+            'file'         : filename,
+            'size'         : None,
+            'engine'       : engine,
+            'solution'     : None,
+            'num_solutions': 0,
+            'limit'        : limit,
+            'is_complete'  : False,
+            'time'         : 0.0,
+            'nodes'        : 0,
+            'error'        : None
+    }
+
+    budget = search.Budget(time_limit=time_limit)
+    try:
+        puzzle = Puzzle()
+        puzzle.read(filename)
+        result['size'] = puzzle.size
+        solns = solver.solve_puzzle(puzzle, engine, limit, budget)
+    except Exception as e:
+        result['error'] = f'{e.__class__.__name__}: {e}'
+        return result
+
+    result['solution']      = solns[0] if solns else None
+    result['num_solutions'] = len(solns)
+    result['is_complete']   = solns.is_complete
+    result['time']          = solns.stats.elapsed
+    result['nodes']         = solns.stats.num_nodes
+    return result
+
+def print_summary(results, elapsed, out, limit=None):
+    """ Print a short human-readable summary of the batch to `out`. The
+        `limit` is the most solutions we looked for in each puzzle.
+    """
+
+    def count(fn):
+        return sum(1 for result in results if fn(result))
+
+    num_errors = count(lambda r: r['error'] is not None)
+    num_incomplete = count(
+            lambda r: r['error'] is None and not r['is_complete']
+    )
+    num_none = count(
+            lambda r: r['is_complete'] and r['num_solutions'] == 0
+    )
+    num_one = count(
+            lambda r: r['is_complete'] and r['num_solutions'] == 1
+    )
+    num_multiple = count(lambda r: r['num_solutions'] > 1)
+    solve_time = sum(result['time'] for result in results)
+
+    print(f'Puzzles:          {len(results)}', file=out)
+    # With a limit of 1, every search stops at its first solution, so we
+    # can't tell whether that solution is unique.
+    if limit is not None and limit < 2:
+        print(f'  solved:         {num_one}', file=out)
+    else:
+        print(f'  unique:         {num_one}', file=out)
+    print(f'  multiple solns: {num_multiple}', file=out)
+    print(f'  no solution:    {num_none}', file=out)
+    print(f'  timed out:      {num_incomplete}', file=out)
+    print(f'  errors:         {num_errors}', file=out)
+    print(f'Solve time:       {solve_time:.2f}s', file=out)
+    print(f'Wall time:        {elapsed:.2f}s', file=out)
+
+
+# ______________________________________________________________________
+# Main
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(
+            description='Solve many .kk files, writing JSON lines.'
+    )
+    parser.add_argument('paths', nargs='+', help='.kk files, dirs, or globs')
+    parser.add_argument(
+            '--engine', default='propagate', choices=sorted(solver.engines)
+    )
+    parser.add_argument(
+            '--limit', type=int, default=2,
+            help='stop counting solutions at this many (default: 2)'
+    )
+    parser.add_argument(
+            '--time-limit', type=float, default=None,
+            help='seconds allowed per puzzle (default: no limit)'
+    )
+    parser.add_argument(
+            '--workers', type=int, default=None,
+            help='number of worker processes (default: one per cpu)'
+    )
+    parser.add_argument(
+            '--output', default=None,
+            help='write JSON lines here instead of to stdout'
+    )
+    args = parser.parse_args(argv)
+
+    filenames = find_puzzle_files(args.paths)
+    tasks = [
+            (filename, args.engine, args.limit, args.time_limit)
+            for filename in filenames
+    ]
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    start_time = time.time()
+    results = []
+    try:
+        with multiprocessing.Pool(args.workers) as pool:
+            for result in pool.imap_unordered(solve_file, tasks, chunksize=1):
+                results.append(result)
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print_summary(results, time.time() - start_time, sys.stderr, args.limit)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+""" bench.py
+
+    Micro-benchmarks for the solver.
+
+    Usage:
+
+        ./bench.py nodes [time_limit_per_puzzle]
+        ./bench.py partitions [max_size]
+        ./bench.py algb
+
+    The `nodes` benchmark measures how many search-tree nodes per second
+    solver.solve_puzzle() can visit on random puzzles of sizes 6x6 to 9x9.
+    Larger random puzzles are not expected to finish in the time limit; we only
+    care about the node throughput here.
+
+    The `partitions` benchmark lists the add and mul partitions of every
+    possible clue for groups of 2 to 6 squares, with repeat limits 1 to 3,
+    for each puzzle size from 3 up to max_size (default 12). It calls the
+    uncached partition.get_addmul_partitions() so that we time the
+    enumeration itself.
+
+    The `algb` benchmark compares alg_b.algorithm_b() with the older
+    recursive_algorithm_b() on two problems: the 9-queens problem, which has
+    a shallow tree, and listing every 5x5 latin square, where each of the
+    161,280 solutions is found at depth 25.
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+import sys
+import time
+from functools import reduce
+from itertools import combinations_with_replacement
+from operator import add, mul
+
+import partition
+import search
+from alg_b import algorithm_b, recursive_algorithm_b
+import solver
+from gen_puzzle import make_random_puzzle
+
+
+# ______________________________________________________________________
+# Internal functions
+
+def count_nodes(puzzle, time_limit, engine='backtrack'):
+    """ Run solver.solve_puzzle(puzzle) for at most `time_limit` seconds, and
+        return (num_nodes, seconds_used).
+    """
+    budget = search.Budget(time_limit=time_limit)
+    solver.solve_puzzle(puzzle, engine, budget=budget)
+    return budget.stats.num_nodes, budget.stats.elapsed
+
+
+# ______________________________________________________________________
+# Benchmarks
+
+def bench_nodes(time_limit=2.0, num_seeds=3):
+    print(f'{"size":>4s} {"seed":>4s} {"nodes":>10s} {"secs":>6s} {"nodes/s":>10s}')
+    for size in range(6, 10):
+        total_nodes, total_time = 0, 0
+        for seed in range(num_seeds):
+            puzzle = make_random_puzzle(size, seed)
+            num_nodes, secs = count_nodes(puzzle, time_limit)
+            total_nodes += num_nodes
+            total_time  += secs
+            rate = num_nodes / secs
+            print(f'{size:4d} {seed:4d} {num_nodes:10d} {secs:6.2f} {rate:10.0f}')
+        rate = total_nodes / total_time
+        print(f'{size:4d}  all {total_nodes:10d} {total_time:6.2f} {rate:10.0f}')
+
+def bench_partitions(max_size=12):
+    print(f'{"size":>4s} {"queries":>8s} {"parts":>8s} {"secs":>6s}')
+    for size in range(3, max_size + 1):
+        num_queries, num_parts, total_time = 0, 0, 0
+        for num_sq in range(2, 7):
+            for op in [add, mul]:
+                # These are all the clues that some group can have.
+                clues = {
+                        reduce(op, nums)
+                        for nums in combinations_with_replacement(
+                            range(1, size + 1),
+                            num_sq
+                        )
+                }
+                start = time.perf_counter()
+                for max_repeat in range(1, 4):
+                    for clue_num in clues:
+                        num_parts += len(partition.get_addmul_partitions(
+                                size,
+                                clue_num,
+                                num_sq,
+                                max_repeat,
+                                op
+                        ))
+                total_time += time.perf_counter() - start
+                num_queries += 3 * len(clues)
+        print(f'{size:4d} {num_queries:8d} {num_parts:8d} {total_time:6.2f}')
+
+def get_queens_problem(n):
+    """ Return the arguments to algorithm_b() for the n-queens problem, where
+        x[row] is the column of the queen in that row.
+    """
+    def is_good(x, ell):
+        row, col = ell - 1, x[ell - 1]
+        return all(
+                x[r] != col and abs(x[r] - col) != row - r
+                for r in range(row)
+        )
+    return [0] * n, [list(range(n))] * n, is_good
+
+def get_latin_problem(n):
+    """ Return the arguments to algorithm_b() for listing all n x n latin
+        squares, in reading order, with update() and downdate() functions.
+    """
+    used_in_row = [0] * n
+    used_in_col = [0] * n
+
+    def is_good(x, ell):
+        sqr = ell - 1
+        bit = 1 << x[sqr]
+        return not (used_in_row[sqr // n] & bit or used_in_col[sqr % n] & bit)
+
+    def update(x, ell):
+        sqr = ell - 1
+        used_in_row[sqr // n] |= 1 << x[sqr]
+        used_in_col[sqr % n]  |= 1 << x[sqr]
+
+    def downdate(x, ell):
+        sqr = ell - 1
+        used_in_row[sqr // n] &= ~(1 << x[sqr])
+        used_in_col[sqr % n]  &= ~(1 << x[sqr])
+
+    return [0] * (n * n), [list(range(n))] * (n * n), is_good, update, downdate
+
+def bench_algb():
+    problems = [
+            ('9-queens', get_queens_problem(9)),
+            ('5x5 latin', get_latin_problem(5))
+    ]
+    print(f'{"problem":>10s} {"version":>10s} {"solns":>8s} {"secs":>6s}')
+    for name, args in problems:
+        for version, alg_fn in [
+                ('recursive', recursive_algorithm_b),
+                ('iterative', algorithm_b)]:
+            start = time.perf_counter()
+            num_solns = sum(1 for x in alg_fn(*args))
+            secs = time.perf_counter() - start
+            print(f'{name:>10s} {version:>10s} {num_solns:8d} {secs:6.2f}')
+
+
+# ______________________________________________________________________
+# Main
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ['nodes', 'partitions', 'algb']:
+        print(__doc__)
+        sys.exit(0)
+
+    if sys.argv[1] == 'nodes':
+        time_limit = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+        bench_nodes(time_limit)
+
+    if sys.argv[1] == 'partitions':
+        max_size = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+        bench_partitions(max_size)
+
+    if sys.argv[1] == 'algb':
+        bench_algb()
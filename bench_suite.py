@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+""" bench_suite.py
+
+    A benchmark suite for the solvers, with regression checks.
+
+    Usage:
+
+        ./bench_suite.py run [options]
+        ./bench_suite.py compare <baseline.json> <results.json> [options]
+        ./bench_suite.py make-corpus
+        ./bench_suite.py check-engines
+
+    The corpus lives in bench_puzzles/. It holds puzzles of sizes 3x3 to 9x9,
+    each with exactly one solution, which is stored in the .kk file. Puzzles
+    with small groups have many givens and are solved quickly; the ones with
+    groups of 2 to 5 squares have few givens, and the larger of those take
+    the engines from a tenth of a second to past the time limit. The list
+    of puzzles and the corpus version are in bench_puzzles/corpus.json.
+    Results are only comparable between runs on the same corpus version, so
+    bump `corpus_version` below whenever the corpus changes.
+
+    The `run` command solves every corpus puzzle with every engine in
+    solver.engines, plus the rule-based solver in rules.py (as engine
+    'rules'). Each solve is repeated, and we record the median wall time, the
+    nodes visited, and the peak memory as measured by tracemalloc in one extra
+    run (so that tracing doesn't slow down the timed runs). Results are
+    written as JSON, along with the full search.SearchStats of the last timed
+    run.
+
+    The `compare` command reports every puzzle/engine pair that got slower,
+    visited more nodes, used more memory, or stopped solving its puzzle
+    correctly. It exits with status 1 if it finds any regressions.
+
+    The `check-engines` command lists every solution of some small puzzles
+    that the corpus doesn't cover -- blank grids, and puzzles with some
+    squares in no group and some groups without clues, as in the editor --
+    with every engine in solver.engines. It exits with status 1 if the
+    engines don't all find the same solutions.
+
+    A typical workflow is to save a baseline before a change:
+
+        ./bench_suite.py run --output baseline.json
+
+    and then check the change against it:
+
+        ./bench_suite.py run --output new.json
+        ./bench_suite.py compare baseline.json new.json
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import rules
+import search
+import solver
+from gen_puzzle import make_random_puzzle, make_unique_puzzle
+from puzzle import Puzzle
+
+
+# ______________________________________________________________________
+# Globals
+
+corpus_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'bench_puzzles')
+corpus_version = 2
+
+# The corpus holds one puzzle per size and recipe here. Each recipe is a
+# (min_group_size, max_group_size, seed) triple.
+corpus_sizes = range(3, 10)
+corpus_recipes = [
+        (1, 3, 0),
+        (1, 4, 0),
+        (1, 4, 1),
+        (2, 5, 0),
+        (2, 5, 1)
+]
+
+# In `compare`, a time or memory increase is only a regression if it's more
+# than this fraction of the baseline value, and more than the matching
+# absolute minimum below. This keeps timer noise on fast puzzles quiet.
+default_threshold = 0.2
+min_time_delta = 0.005      # seconds
+min_mem_delta  = 16 * 1024  # bytes
+
+
+# ______________________________________________________________________
+# Internal functions
+
+def get_corpus():
+    """ Return a list of (name, puzzle) pairs for the corpus puzzles. """
+
+    with open(os.path.join(corpus_dir, 'corpus.json')) as f:
+        manifest = json.load(f)
+    if manifest['version'] != corpus_version:
+        raise ValueError(
+                f'bench_puzzles/ is corpus version {manifest["version"]}, '
+                f'but bench_suite.py expects version {corpus_version}.'
+        )
+
+    corpus = []
+    for entry in manifest['puzzles']:
+        puzzle = Puzzle()
+        puzzle.read(os.path.join(corpus_dir, entry['file']))
+        corpus.append((entry['file'], puzzle))
+    return corpus
+
+def solve_once(puzzle, engine, time_limit):
+    """ Solve `puzzle` with `engine` and return (soln, budget), where `soln`
+        is the first solution found, or None.
+    """
+
+    budget = search.Budget(time_limit=time_limit)
+    if engine == 'rules':
+        steps, soln = rules.solve(puzzle, budget)
+        solns = [soln]
+    else:
+        solns = solver.solve_puzzle(puzzle, engine, 1, budget)
+    return (solns[0] if solns else None), budget
+
+def bench_one(puzzle, engine, num_reps, time_limit):
+    """ Return a result dict for one puzzle/engine pair. """
+
+    times = []
+    for _ in range(num_reps):
+        soln, budget = solve_once(puzzle, engine, time_limit)
+        times.append(budget.stats.elapsed)
+
+    tracemalloc.start()
+    solve_once(puzzle, engine, time_limit)
+    peak_mem = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+            'time'       : statistics.median(times),
+            'times'      : times,
+            'nodes'      : budget.stats.num_nodes,
+            'peak_mem'   : peak_mem,
+            'is_complete': budget.stop_reason is None,
+            'is_correct' : soln == puzzle.solution,
+            'stats'      : budget.stats.as_dict()
+    }
+
+def get_check_puzzles():
+    """ Return a list of (name, puzzle) pairs for `check-engines`. """
+
+    puzzles = [(f'blank {size}x{size}', Puzzle(size)) for size in (3, 4)]
+    for size, seed in [(4, 0), (4, 1), (5, 0), (5, 1)]:
+        puzzle = make_random_puzzle(size, seed, 3)
+        # Drop every third group, so its squares are in no group, and clear
+        # the clue of every other group that's left.
+        groups = [group for i, group in enumerate(puzzle.groups) if i % 3]
+        for group in groups[::2]:
+            group[0] = ''
+        puzzle.groups = groups
+        puzzles.append((f'partial {size}x{size} s{seed}', puzzle))
+    return puzzles
+
+def get_key(result):
+    return (result['puzzle'], result['engine'])
+
+def find_regressions(base, new, threshold):
+    """ Return a list of strings, each describing a regression from the
+        result dict `base` to the result dict `new`.
+    """
+
+    regressions = []
+
+    if base['is_correct'] and not new['is_correct']:
+        regressions.append('no longer solved correctly')
+    if base['is_complete'] and not new['is_complete']:
+        regressions.append('now runs out of time')
+
+    def check(key, min_delta, fmt):
+        delta = new[key] - base[key]
+        if delta > min_delta and delta > threshold * base[key]:
+            old, now = fmt(base[key]), fmt(new[key])
+            regressions.append(f'{key} {old} -> {now}')
+
+    check('time', min_time_delta, lambda t: f'{t:.4f}s')
+    check('nodes', 0, str)
+    check('peak_mem', min_mem_delta, lambda m: f'{m / 1024:.0f}K')
+
+    return regressions
+
+
+# ______________________________________________________________________
+# Commands
+
+def make_corpus():
+    """ Write the corpus puzzles and manifest into bench_puzzles/. """
+
+    os.makedirs(corpus_dir, exist_ok=True)
+    entries = []
+    for size in corpus_sizes:
+        for min_group_size, max_group_size, seed in corpus_recipes:
+            puzzle = make_unique_puzzle(
+                    size,
+                    seed,
+                    max_group_size,
+                    min_group_size=min_group_size
+            )
+            group_sizes = str(max_group_size)
+            if min_group_size > 1:
+                group_sizes = f'{min_group_size}-{max_group_size}'
+            filename = f'{size}x{size}_g{group_sizes}_s{seed}.kk'
+            puzzle.write(os.path.join(corpus_dir, filename))
+            entries.append({
+                    'file'          : filename,
+                    'size'          : size,
+                    'min_group_size': min_group_size,
+                    'max_group_size': max_group_size,
+                    'seed'          : seed
+            })
+            print('Wrote', filename)
+
+    manifest = {'version': corpus_version, 'puzzles': entries}
+    with open(os.path.join(corpus_dir, 'corpus.json'), 'w') as f:
+        json.dump(manifest, f, indent=4)
+        f.write('\n')
+
+def run(args):
+    engines = args.engines or sorted(solver.engines) + ['rules']
+    for engine in engines:
+        if engine != 'rules' and engine not in solver.engines:
+            raise ValueError(f'Unknown engine: {engine}')
+
+    results = []
+    for name, puzzle in get_corpus():
+        for engine in engines:
+            result = bench_one(puzzle, engine, args.reps, args.time_limit)
+            result['puzzle'] = name
+            result['engine'] = engine
+            results.append(result)
+            flags = '' if result['is_correct'] else ' (unsolved)'
+            print(
+                    f'{name:16s} {engine:10s} {result["time"]:8.4f}s '
+                    f'{result["nodes"]:9d} nodes '
+                    f'{result["peak_mem"] / 1024:8.0f}K{flags}',
+                    file=sys.stderr
+            )
+
+    output = {
+            'corpus_version': corpus_version,
+            'date'          : time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python'        : platform.python_version(),
+            'machine'       : platform.platform(),
+            'reps'          : args.reps,
+            'time_limit'    : args.time_limit,
+            'results'       : results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=1)
+        f.write('\n')
+    print('Wrote', args.output, file=sys.stderr)
+
+def check_engines(args):
+    """ Print any puzzle whose solutions differ between engines, and return
+        the number of such puzzles.
+    """
+
+    num_mismatches = 0
+    for name, puzzle in get_check_puzzles():
+        solns = {}
+        for engine in sorted(solver.engines):
+            budget = search.Budget(time_limit=args.time_limit)
+            result = solver.solve_puzzle(puzzle, engine, budget=budget)
+            if not result.is_complete:
+                print(f'{name:16s} {engine:10s} ran out of time')
+                num_mismatches += 1
+                continue
+            solns[engine] = sorted(map(tuple, result))
+        counts = {engine: len(engine_solns)
+                  for engine, engine_solns in solns.items()}
+        is_ok = len({tuple(v) for v in solns.values()}) <= 1
+        print(f'{name:16s} {"ok" if is_ok else "MISMATCH"} {counts}')
+        num_mismatches += not is_ok
+
+    print(f'{num_mismatches} mismatch(es) found.')
+    return num_mismatches
+
+def compare(args):
+    """ Print regressions from args.baseline to args.results, and return the
+        number of regressions found.
+    """
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.results) as f:
+        results = json.load(f)
+
+    if baseline['corpus_version'] != results['corpus_version']:
+        print('Warning: these results use different corpus versions.')
+
+    base_results = {get_key(result): result for result in baseline['results']}
+    num_regressions = 0
+    for result in results['results']:
+        key = get_key(result)
+        if key not in base_results:
+            continue
+        for regression in find_regressions(
+                base_results[key],
+                result,
+                args.threshold):
+            print(f'{key[0]:16s} {key[1]:10s} {regression}')
+            num_regressions += 1
+
+    print(f'{num_regressions} regression(s) found.')
+    return num_regressions
+
+
+# ______________________________________________________________________
+# Main
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description='Solver benchmark suite.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument(
+            '--engines', type=lambda s: s.split(','), default=None,
+            help='comma-separated engines to run (default: all)'
+    )
+    run_parser.add_argument('--reps', type=int, default=3)
+    run_parser.add_argument(
+            '--time-limit', type=float, default=10.0,
+            help='seconds allowed per solve (default: 10)'
+    )
+    run_parser.add_argument('--output', default='bench_results.json')
+
+    compare_parser = commands.add_parser(
+            'compare',
+            help='find regressions against a baseline'
+    )
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument(
+            '--threshold', type=float, default=default_threshold,
+            help='allowed fractional increase (default: 0.2)'
+    )
+
+    commands.add_parser('make-corpus', help='regenerate bench_puzzles/')
+
+    check_parser = commands.add_parser(
+            'check-engines',
+            help='check that the engines agree on small puzzles'
+    )
+    check_parser.add_argument(
+            '--time-limit', type=float, default=30.0,
+            help='seconds allowed per solve (default: 30)'
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        run(args)
+    elif args.command == 'compare':
+        sys.exit(1 if compare(args) else 0)
+    elif args.command == 'check-engines':
+        sys.exit(1 if check_engines(args) else 0)
+    else:
+        make_corpus()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,221 @@
+""" bg_solve.py
+
+    Run the solver in a background process.
+
+    The editor uses this so that it can stay responsive during a long solve.
+    Creating a Job starts a worker process; the editor then calls job.poll()
+    from an event.py tick callback to pick up progress reports and, at the
+    end, the result.
+
+    Sample usage:
+
+        job = bg_solve.Job(puzzle, max_solutions=2)
+
+        def check_on_job(num_ticks):
+            if job.poll():
+                event.callbacks.remove(check_on_job)
+                if not job.is_stale():
+                    use_solutions(job.result['solns'])
+
+        event.callbacks.append(check_on_job)
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+import multiprocessing
+import queue
+import time
+
+import rules
+import search
+import solver
+
+
+# ______________________________________________________________________
+# Globals
+
+# Workers send a progress report about this often, in seconds.
+progress_interval = 0.5
+
+
+# ______________________________________________________________________
+# Internal functions
+
+def run_job(
+        puzzle,
+        task,
+        engine,
+        max_solutions,
+        time_limit,
+        msg_queue,
+        cancel):
+    """ This is the main function of a worker process. The `task` is one of
+        'solve', 'count', or 'rules'; see Job. It sends messages of the form
+        (kind, data) on `msg_queue`, where `kind` is one of:
+
+        * 'progress' A stats dict as given by SearchStats.as_dict().
+        * 'done'     A result dict; see Job.result.
+        * 'error'    A string describing an exception.
+    """
+
+    def send_progress(stats):
+        msg_queue.put(('progress', stats.as_dict()))
+
+    budget = search.Budget(
+            time_limit=time_limit,
+            cancel=cancel,
+            progress=send_progress,
+            progress_interval=progress_interval
+    )
+
+    try:
+        if task == 'count':
+            count = solver.estimate_num_solutions(puzzle, engine, budget)
+        elif task == 'rules':
+            steps, grid = rules.solve(puzzle, budget)
+            solns = search.SolveResult([grid], budget, 'rules')
+        else:
+            solns = solver.solve_puzzle(puzzle, engine, max_solutions, budget)
+    except Exception as e:
+        msg_queue.put(('error', f'{e.__class__.__name__}: {e}'))
+        return
+
+    if task == 'count':
+        msg_queue.put(('done', count.as_dict()))
+        return
+
+    result = {
+            'solns'      : list(solns),
+            'is_complete': solns.is_complete,
+            'stop_reason': solns.stop_reason,
+            'stats'      : solns.stats.as_dict()
+    }
+    if task == 'rules':
+        result['steps'] = steps
+    msg_queue.put(('done', result))
+
+
+# ______________________________________________________________________
+# Classes
+
+class Job(object):
+    """ A solver run in a worker process.
+
+        The `task` is 'solve' to find up to `max_solutions` solutions, or
+        'count' to count the solutions, or estimate the count if there are
+        too many; see solver.estimate_num_solutions(). The 'rules' task runs
+        the rule-based solver, rules.solve(), and ignores `engine` and
+        `max_solutions`.
+
+        After poll() returns True, exactly one of these is set:
+
+        * `result` For a 'solve' task, a dict with the keys 'solns',
+                   'is_complete', 'stop_reason', and 'stats', with the same
+                   meanings as in search.SolveResult. A 'rules' task gives
+                   the same keys plus 'steps', the list of deductions; its
+                   only solution has '?' for each unknown square. For a
+                   'count' task, the dict given by
+                   search.CountResult.as_dict(). Either way, 'stats' is a
+                   dict.
+        * `error`  A string describing what went wrong.
+
+        While the job runs, `progress` holds the most recent stats dict, or
+        None if we haven't heard from the worker yet.
+    """
+
+    def __init__(
+            self,
+            puzzle,
+            max_solutions=2,
+            engine='propagate',
+            time_limit=None,
+            task='solve'):
+
+        self.puzzle   = puzzle
+        self.version  = puzzle.version
+        self.progress = None
+        self.result   = None
+        self.error    = None
+        self.is_done  = False
+
+        self.msg_queue    = multiprocessing.Queue()
+        self.cancel_event = multiprocessing.Event()
+        self.process = multiprocessing.Process(
+                target=run_job,
+                args=(
+                    puzzle,
+                    task,
+                    engine,
+                    max_solutions,
+                    time_limit,
+                    self.msg_queue,
+                    self.cancel_event
+                ),
+                daemon=True
+        )
+        self.process.start()
+
+    def handle_msg(self, kind, data):
+        if kind == 'progress':
+            self.progress = data
+        elif kind == 'done':
+            self.result = data
+            self.is_done = True
+        else:
+            self.error = data
+            self.is_done = True
+
+    def poll(self):
+        """ Handle any messages from the worker without blocking. This returns
+            True once the job is finished.
+        """
+
+        if self.is_done:
+            return True
+
+        while not self.is_done:
+            try:
+                self.handle_msg(*self.msg_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        # If the worker has exited, its last message may still be in transit.
+        if not self.is_done and not self.process.is_alive():
+            try:
+                self.handle_msg(*self.msg_queue.get(timeout=0.1))
+            except queue.Empty:
+                self.error = 'The solver process exited unexpectedly.'
+                self.is_done = True
+
+        if self.is_done:
+            self.process.join()
+
+        return self.is_done
+
+    def cancel(self):
+        """ Ask the worker to stop. The job still finishes normally, with a
+            stop_reason of 'cancel' in its result.
+        """
+        self.cancel_event.set()
+
+    def close(self, timeout=1.0):
+        """ Cancel the job and wait for its worker to exit. If the worker
+            hasn't stopped within `timeout` seconds, we terminate it. Use this
+            instead of cancel() when nobody will poll() the job again, so the
+            worker process is always reaped.
+        """
+        self.cancel()
+        # We keep reading messages while we wait, since a worker can't exit
+        # while it still has messages waiting to go into a full queue.
+        end = time.monotonic() + timeout
+        while not self.poll() and time.monotonic() < end:
+            time.sleep(0.01)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+    def is_stale(self):
+        """ Return True if the puzzle has changed since this job started. """
+        return self.puzzle.version != self.version
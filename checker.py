@@ -0,0 +1,200 @@
+""" checker.py
+
+    Compile a puzzle into functions that quickly check partial solutions.
+
+    The backtrack engine in solver.py fills in squares in reading order, and
+    at each search node it asks whether the newest square breaks a rule.
+    Rather than look at the clue strings and work out square indexes at every
+    node, we do that work once, here, and build one check function per square.
+    Since the squares are always filled in the same order, the check for a
+    square already knows which earlier squares share its group. So it can use
+    fixed indexes into the solution list, and it needs no running totals.
+
+    The checks only test clues. Rows and columns are checked by the backtrack
+    engine itself, with bitmasks of the values used in each line that it
+    keeps up to date as it moves through the tree. That takes one test per
+    line, where scanning the earlier squares of a line would take up to N - 1.
+
+    There are two ways to build the checks. Both start from get_sqr_infos(),
+    which gives the parsed clue of the group holding each square.
+    make_checks() builds the checks as closures, while make_source() writes
+    Python source with every test unrolled, and compile_checks() compiles that
+    source. The compiled version is faster, and it's what the backtrack engine
+    uses.
+
+    A check accepts the list x of values in reading order, where x[sqr] is the
+    square being checked and every earlier square is filled in. It returns
+    None if x[sqr] fits its group's clue, or the prune reason (see
+    search.SearchStats) if not.
+
+    Sample usage:
+
+        checks = checker.compile_checks(puzzle)
+        reason = checks[sqr](x)
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+from puzzle import Op
+
+
+# ______________________________________________________________________
+# Internal functions
+
+def get_sqr_infos(puzzle):
+    """ Return a list with one (op, clue_num, earlier, is_last) tuple for each
+        square, in reading order, describing the clue of the group holding
+        that square.
+
+        The `op` is a puzzle.Op, or None for a square without a clued group,
+        in which case the other values are None as well. `earlier`
+        is the tuple of indexes of the other squares in the group that come
+        before this one, and `is_last` is True when this square is the last
+        in the group to be filled in.
+    """
+
+    N = puzzle.size
+    infos = [(None, None, None, None)] * (N * N)
+
+    # Groups without a clue (eg, while editing) don't constrain their squares.
+    for group, clue in puzzle.get_clued_groups():
+        if clue.op == Op.GIVEN:
+            assert len(group) == 2
+        sqrs = sorted(x + N * y for x, y in group[1:])
+        for k, sqr in enumerate(sqrs):
+            is_last = (k == len(sqrs) - 1)
+            infos[sqr] = (clue.op, clue.num, tuple(sqrs[:k]), is_last)
+
+    return infos
+
+def make_check(sqr, info):
+    """ Return a check function for square `sqr`, as described at the top of
+        this file. Here, `info` is as given by get_sqr_infos().
+    """
+
+    op, clue_num, earlier, is_last = info
+    reason = op.value if op else None
+
+    def check(x):
+
+        if op is None:
+            return None
+
+        val = x[sqr]
+
+        if op == Op.GIVEN:
+            is_ok = (val == clue_num)
+
+        elif op == Op.ADD:
+            sum_ = val
+            for i in earlier:
+                sum_ += x[i]
+            is_ok = (sum_ == clue_num) if is_last else (sum_ < clue_num)
+
+        elif op == Op.MUL:
+            product = val
+            for i in earlier:
+                product *= x[i]
+            if is_last:
+                is_ok = (product == clue_num)
+            else:
+                is_ok = (clue_num % product == 0)
+
+        # The remaining ops are for two-square groups, so the only check is
+        # when the second value arrives.
+        elif not is_last:
+            is_ok = True
+
+        else:
+            other = sum(x[i] for i in earlier)
+            if op == Op.SUB:
+                is_ok = (abs(other - val) == clue_num)
+            else:
+                lo, hi = min(other, val), max(other, val)
+                is_ok = (hi == lo * clue_num)
+
+        return None if is_ok else reason
+
+    return check
+
+def get_clue_test(info):
+    """ Return a Python expression, using the names `x` and `val`, which is
+        True when the clue described by `info` is broken; or return None if
+        there's nothing to test. The `info` is as given by get_sqr_infos().
+    """
+
+    op, clue_num, earlier, is_last = info
+    if op is None:
+        return None
+
+    terms = [f'x[{i}]' for i in earlier]
+
+    if op == Op.GIVEN:
+        return f'val != {clue_num}'
+
+    if op == Op.ADD:
+        sum_ = ' + '.join(terms + ['val'])
+        return f'{sum_} != {clue_num}' if is_last else f'{sum_} >= {clue_num}'
+
+    if op == Op.MUL:
+        product = ' * '.join(terms + ['val'])
+        if is_last:
+            return f'{product} != {clue_num}'
+        return f'{clue_num} % ({product})'
+
+    if not is_last:
+        return None
+
+    other = terms[0] if len(terms) == 1 else f'({" + ".join(terms)})'
+    if op == Op.SUB:
+        return f'abs({other} - val) != {clue_num}'
+    return (
+            f'{other} != val * {clue_num} and '
+            f'val != {other} * {clue_num}'
+    )
+
+
+# ______________________________________________________________________
+# Public functions
+
+def make_checks(puzzle):
+    """ Return a list with the check function of each square in reading
+        order, built as closures.
+    """
+    return [
+            make_check(sqr, info)
+            for sqr, info in enumerate(get_sqr_infos(puzzle))
+    ]
+
+def make_source(puzzle):
+    """ Return Python source that defines the functions check_0, check_1,
+        ..., one for each square, along with the list `checks` of all of
+        them in reading order.
+    """
+
+    N = puzzle.size
+    lines = []
+
+    for sqr, info in enumerate(get_sqr_infos(puzzle)):
+        test = get_clue_test(info)
+        lines.append(f'def check_{sqr}(x):')
+        if test is not None:
+            lines.append(f'    val = x[{sqr}]')
+            lines.append(f'    if {test}: return {info[0].value!r}')
+        lines.append(f'    return None')
+        lines.append('')
+
+    checks = ', '.join(f'check_{sqr}' for sqr in range(N * N))
+    lines.append(f'checks = [{checks}]')
+    return '\n'.join(lines) + '\n'
+
+def compile_checks(puzzle):
+    """ Return a list with the check function of each square in reading
+        order, compiled from the source given by make_source().
+    """
+    namespace = {}
+    code = compile(make_source(puzzle), '<checker>', 'exec')
+    exec(code, namespace)
+    return namespace['checks']
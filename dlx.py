@@ -0,0 +1,322 @@
+""" dlx.py
+
+    An exact-cover solver engine based on dancing links.
+
+    The main function is algorithm_x(), named after algorithm 7.2.2.1X in
+    Donald Knuth's The Art of Computer Programming. It finds all ways to choose
+    options (sets of items) so that each item is covered exactly once.
+
+    A KenKen puzzle becomes an exact cover problem with these items:
+
+        * square (x, y) is filled,
+        * row y has value v,
+        * column x has value v.
+
+    Each option is a full placement of values into one group, as listed by
+    partition.get_group_placements(). A square that isn't in any clued group
+    acts like a one-square group that can hold any value.
+
+    A large group can have a huge number of placements. If a group has more
+    than max_group_placements of them, we treat its squares as though they
+    were in no group, and instead check its clue against each exact cover
+    that we find. The budget is checked while placements are listed.
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+import partition
+import search
+
+
+# ______________________________________________________________________
+# Globals
+
+# Groups with more placements than this are checked after the search instead
+# of becoming options.
+max_group_placements = 20000
+
+
+# ______________________________________________________________________
+# Public functions
+
+def algorithm_x(
+        num_items,
+        options,
+        budget=None,
+        item_kinds=None,
+        trace=None):
+    """ This is Knuth's Algorithm X, using dancing links.
+
+        The items are the integers 0, 1, ..., num_items - 1, and `options` is
+        a list of lists of items. This yields each exact cover as a list of
+        indexes into `options`.
+
+        At each level we branch on an item with the fewest remaining options,
+        as Knuth recommends. If a search.Budget is given, we call its tick()
+        method each time we try an option, and record statistics in
+        budget.stats. When the chosen item has no options left, that's a
+        prune, and its reason is item_kinds[item] if `item_kinds` is given.
+
+        If given, trace(depth, opt_idx, pruned_by) is called once we know
+        whether the option opt_idx, tried at the given depth, is pruned.
+    """
+
+    if budget is None:
+        budget = search.Budget()
+    tick  = budget.tick
+    stats = budget.stats
+
+    # We use Knuth's sequential layout. Node 0 is the root, nodes 1..n are the
+    # item headers, and the options follow, each one preceded by a spacer.
+    # For item headers, `top` holds the length of that item's list. For
+    # spacers, `top` is <= 0, `ulink` is the first node of the previous
+    # option, and `dlink` is the last node of the next option.
+
+    n = num_items
+    llink = [n] + list(range(n))
+    rlink = list(range(1, n + 1)) + [0]
+
+    top   = [0] * (n + 1)
+    ulink = list(range(n + 1))
+    dlink = list(range(n + 1))
+    opt_of_node = [-1] * (n + 1)
+
+    # The first spacer.
+    top.append(0)
+    ulink.append(0)
+    dlink.append(0)
+    opt_of_node.append(-1)
+    spacer = n + 1
+
+    for opt_idx, option in enumerate(options):
+        first = len(top)
+        for item in option:
+            i = item + 1
+            node = len(top)
+            top.append(i)
+            top[i] += 1
+            ulink.append(ulink[i])
+            dlink.append(i)
+            dlink[ulink[i]] = node
+            ulink[i] = node
+            opt_of_node.append(opt_idx)
+        dlink[spacer] = len(top) - 1
+        spacer = len(top)
+        top.append(-(opt_idx + 1))
+        ulink.append(first)
+        dlink.append(0)
+        opt_of_node.append(-1)
+
+    def hide(p):
+        q = p + 1
+        while q != p:
+            x = top[q]
+            if x <= 0:
+                q = ulink[q]
+            else:
+                u, d = ulink[q], dlink[q]
+                dlink[u] = d
+                ulink[d] = u
+                top[x] -= 1
+                q += 1
+
+    def unhide(p):
+        q = p - 1
+        while q != p:
+            x = top[q]
+            if x <= 0:
+                q = dlink[q]
+            else:
+                u, d = ulink[q], dlink[q]
+                dlink[u] = q
+                ulink[d] = q
+                top[x] += 1
+                q -= 1
+
+    def cover(i):
+        p = dlink[i]
+        while p != i:
+            hide(p)
+            p = dlink[p]
+        l, r = llink[i], rlink[i]
+        rlink[l] = r
+        llink[r] = l
+
+    def uncover(i):
+        l, r = llink[i], rlink[i]
+        rlink[l] = i
+        llink[r] = i
+        p = ulink[i]
+        while p != i:
+            unhide(p)
+            p = ulink[p]
+
+    def cover_others(p):
+        """ Cover the items of the option with node p, other than top[p]. """
+        q = p + 1
+        while q != p:
+            j = top[q]
+            if j <= 0:
+                q = ulink[q]
+            else:
+                cover(j)
+                q += 1
+
+    def uncover_others(p):
+        """ Undo cover_others(p). """
+        q = p - 1
+        while q != p:
+            j = top[q]
+            if j <= 0:
+                q = dlink[q]
+            else:
+                uncover(j)
+                q -= 1
+
+    def choose_item():
+        best, best_len = -1, len(options) + 1
+        i = rlink[0]
+        while i != 0:
+            if top[i] < best_len:
+                best, best_len = i, top[i]
+                if best_len == 0:
+                    break
+            i = rlink[i]
+        return best
+
+    # x[ell] is the node of the option chosen at level ell. The steps below
+    # are labeled as in Knuth's description.
+    x = []
+    step = 2
+
+    while True:
+
+        if step == 2:    # X2. Enter a level.
+            if len(x) > stats.max_depth:
+                stats.max_depth = len(x)
+            if rlink[0] == 0:
+                if trace and x:
+                    trace(len(x), opt_of_node[x[-1]], None)
+                yield [opt_of_node[p] for p in x]
+                step = 8
+                continue
+            i = choose_item()  # X3. Choose i.
+            reason = None
+            if top[i] == 0:
+                reason = item_kinds[i - 1] if item_kinds else 'item'
+                stats.prunes[reason] += 1
+            if trace and x:
+                trace(len(x), opt_of_node[x[-1]], reason)
+            cover(i)           # X4. Cover i.
+            x.append(dlink[i])
+            step = 5
+
+        elif step == 5:  # X5. Try x[ell].
+            p = x[-1]
+            if p <= n:  # We're back at the item header; backtrack.
+                uncover(p)     # X7. Backtrack.
+                x.pop()
+                step = 8
+            else:
+                tick()
+                cover_others(p)
+                step = 2
+
+        elif step == 6:  # X6. Try again.
+            p = x[-1]
+            stats.num_backtracks += 1
+            uncover_others(p)
+            x[-1] = dlink[p]
+            step = 5
+
+        else:            # X8. Leave a level.
+            if len(x) == 0:
+                return
+            step = 6
+
+def iter_solns(puzzle, budget=None):
+    """ Yield each solution of `puzzle` as a list of numbers in reading order.
+    """
+
+    N = puzzle.size
+
+    # Item indexes for the three kinds of items.
+    def sqr_item(x, y):
+        return x + N * y
+    def row_item(y, val):
+        return N * N + y * N + (val - 1)
+    def col_item(x, val):
+        return 2 * N * N + x * N + (val - 1)
+
+    # Each option is recorded as the list of (pt, val) pairs it sets.
+    settings = []
+    options  = []
+
+    def add_option(pts, values):
+        settings.append(list(zip(pts, values)))
+        options.append(
+                [sqr_item(*pt) for pt in pts] +
+                [row_item(pt[1], v) for pt, v in zip(pts, values)] +
+                [col_item(pt[0], v) for pt, v in zip(pts, values)]
+        )
+
+    if budget is None:
+        budget = search.Budget()
+
+    # Each late check is (pts, parts, reason) for a group that was too big to
+    # list, where `parts` is the set of its partitions as tuples.
+    late_checks = []
+
+    with budget.phase('setup'):
+        grouped_pts = set()
+        # Groups without a clue don't constrain their squares yet.
+        for group, clue in puzzle.get_clued_groups():
+            pts = group[1:]
+            placements = partition.get_group_placements(
+                    puzzle,
+                    group,
+                    max_group_placements,
+                    budget
+            )
+            if placements is None:
+                parts = partition.get_group_partitions(puzzle, group, budget)
+                late_checks.append((
+                        pts,
+                        {tuple(part) for part in parts},
+                        clue.op.value
+                ))
+                continue
+            grouped_pts.update(pts)
+            for values in placements:
+                add_option(pts, values)
+
+        for x in range(N):
+            for y in range(N):
+                if (x, y) not in grouped_pts:
+                    for val in range(1, N + 1):
+                        add_option([(x, y)], [val])
+
+    item_kinds = ['square'] * (N * N) + ['row'] * (N * N) + ['col'] * (N * N)
+
+    trace = None
+    if budget.trace:
+        def trace(depth, opt_idx, pruned_by):
+            budget.trace(depth, settings[opt_idx], pruned_by)
+
+    soln = [0] * (N * N)
+    for cover in algorithm_x(3 * N * N, options, budget, item_kinds, trace):
+        for opt_idx in cover:
+            for (x, y), val in settings[opt_idx]:
+                soln[x + N * y] = val
+        # Every partition is sorted, and rows and columns are already known
+        # to be fine, so each big group only needs its sorted values checked.
+        reason = next((
+                reason for pts, parts, reason in late_checks
+                if tuple(sorted(soln[x + N * y] for x, y in pts)) not in parts
+        ), None)
+        if reason is not None:
+            budget.stats.prunes[reason] += 1
+            continue
+        yield soln
@@ -23,12 +23,12 @@ import sys
 import time
 
 # Local imports.
+import bg_solve
 import dbg
 import drawing
 import event
 import partition
 import sevendate
-import solver
 from pdf_maker import make_pdf
 from puzzle    import Puzzle
 
@@ -38,6 +38,15 @@ from puzzle    import Puzzle
 
 stdscr = None
 
+# The experimental solver gives up after this many seconds.
+solve_time_limit = 10
+
+# This is the bg_solve.Job for the current background solve, if there is one.
+# When it finishes, we call bg_job_when_done(result) unless the puzzle has
+# changed since the job started.
+bg_job = None
+bg_job_when_done = None
+
 
 # ______________________________________________________________________
 # Functions
@@ -70,6 +79,109 @@ def clear_status():
         event.callbacks.remove(fade_out_status)
     drawing.show_status(stdscr, '')
 
+def start_bg_job(puzzle, when_done, **kwargs):
+    """ Start solving `puzzle` in a background process, replacing any solve
+        that's already running. The keyword args are passed on to
+        bg_solve.Job(). Progress is shown in the status line, and
+        `when_done(result)` is called once the job finishes.
+    """
+    global bg_job, bg_job_when_done
+
+    # The replaced job's result would be ignored, so we stop and reap it.
+    if bg_job is not None:
+        bg_job.close()
+    bg_job = bg_solve.Job(puzzle, **kwargs)
+    bg_job_when_done = when_done
+    show_status('Solving ... (Esc to cancel)')
+
+def check_on_bg_job(num_ticks):
+    """ This is an event.py callback that tracks the background solve. """
+    global stdscr, bg_job
+
+    job = bg_job
+    if job is None:
+        return
+
+    if not job.poll():
+        if job.progress is not None:
+            secs = job.progress['elapsed']
+            rate = job.progress['nodes_per_sec']
+            show_status(
+                    f'Solving: {secs:.1f}s, {rate:,.0f} nodes/s '
+                    '(Esc to cancel)'
+            )
+        return
+
+    bg_job = None
+    if job.is_stale():
+        show_status('Discarded a result for an older version of the puzzle.')
+    elif job.error is not None:
+        show_status(f'Solver error: {job.error}')
+    else:
+        bg_job_when_done(job.result)
+        job.puzzle.draw(stdscr, job.puzzle.x0, job.puzzle.y0)
+        stdscr.refresh()
+
+def show_solve_result(puzzle, result):
+    """ Add the first solution in `result` (from a bg_solve.Job) to the
+        puzzle, and report what we learned in the status line.
+    """
+    solns = result['solns']
+    dbg.print('Solver stats:', result['stats'])
+    if len(solns) > 0:
+        # XXX
+        dbg.print('Adding the solution:', solns[0])
+        puzzle.add_solution(solns[0])
+    if len(solns) == 2:
+        msg = 'Found a solution (not unique)'
+    elif result['stop_reason'] == 'cancel':
+        msg = 'Solver canceled'
+    elif not result['is_complete']:
+        if len(solns) == 0:
+            msg = 'Gave up without finding a solution'
+        else:
+            msg = 'Found a solution (uniqueness unknown)'
+    elif len(solns) == 1:
+        msg = 'Found the unique solution'
+    else:
+        msg = 'No solutions found'
+    show_status(f'{msg} in {result["stats"]["elapsed"]:.2f}s.')
+
+def show_rules_result(puzzle, result):
+    """ Add the (possibly partial) grid in `result`, from a bg_solve.Job with
+        task='rules', to the puzzle, and report how it went in the status
+        line.
+    """
+    dbg.print('Experimental solver stats:', result['stats'])
+    grid = result['solns'][0]
+    puzzle.add_solution(grid)
+    secs = result['stats']['elapsed']
+    if not result['is_complete']:
+        msg = f'Experimental solver stopped ({result["stop_reason"]})'
+    elif '?' in grid:
+        msg = 'Experimental solver got stuck'
+    else:
+        msg = 'Experimental solver found the solution'
+    show_status(f'{msg} in {secs:.2f}s.')
+
+def show_count_result(result):
+    """ Report the number of solutions in `result` (from a bg_solve.Job with
+        task='count') in the status line.
+    """
+    dbg.print('Count stats:', result['stats'])
+    num = result['num_solns']
+    secs = result['stats']['elapsed']
+    if result['is_exact']:
+        msg = f'Found exactly {num:,} solution{"s" * (num != 1)}'
+    elif result['hi'] is not None:
+        lo, hi = result['lo'], result['hi']
+        msg = f'About {num:,} solutions (likely {lo:,} to {hi:,})'
+    elif result['stop_reason'] == 'cancel':
+        msg = f'Count canceled; at least {num:,} solutions'
+    else:
+        msg = f'At least {num:,} solutions'
+    show_status(f'{msg} in {secs:.2f}s.')
+
 def refresh_screen(puzzle):
     """ Erase the screen and recalculate the upper-left corner of a puzzle.
         This is useful when either the screen or the puzzle is resized, or
@@ -107,6 +219,8 @@ def draw_help_screen():
         o    Save the puzzle to a pdf and open the pdf file.
         e    Run the experimental puzzle solver.
         f    Find the solution to the given puzzle.
+        n    Count (or estimate) the number of solutions.
+        esc  Cancel a running solve.
         c    Start editing clues at the current group.
         s    Set the puzzle size.
         w    Type a filename, this puzzle is saved to that file.
@@ -188,32 +302,10 @@ def update_availale_partitions(stdscr, puzzle):
     """
     group = puzzle.get_group_at_cursor()
 
-    part_fn_map = {
-            puzzle.add_char: partition.get_add_partitions,
-            puzzle.sub_char: partition.get_sub_partitions,
-            puzzle.mul_char: partition.get_mul_partitions,
-            puzzle.div_char: partition.get_div_partitions
-    }
-
-    clue = group[0]
-
-    if clue == '':
+    if puzzle.get_clue(group).op is None:
         return
 
-    op_char = clue[-1]
-    if op_char in puzzle.op_chars:
-        num_sq = len(group) - 1
-        group_w = len({pt[0] for pt in group[1:]})
-        group_h = len({pt[1] for pt in group[1:]})
-        max_repeat = min(group_w, group_h)
-        parts = part_fn_map[op_char](
-                puzzle.size,
-                int(clue[:-1]),
-                num_sq,
-                max_repeat
-        )
-    else:
-        parts = [[int(clue)]]
+    parts = partition.get_group_partitions(puzzle, group)
 
     dbg.print(parts)
 
@@ -250,6 +342,7 @@ def main(stdscr_):
     leader, prev_leader = '', ''
 
     show_status('Press ? to see the help screen.')
+    event.callbacks.append(check_on_bg_job)
 
     while True:
 
@@ -262,8 +355,15 @@ def main(stdscr_):
 
         if key == 'q' or key == 'Q':  #### qQ   = Quit
 
+            if bg_job is not None:
+                bg_job.close()
             break
 
+        elif key == '\x1b':           #### Esc  = cancel a background solve
+
+            if bg_job is not None:
+                bg_job.cancel()
+
         elif key in 'hjkl':           #### hjkl = cursor movement
 
             for i in range(2):
@@ -339,18 +439,33 @@ def main(stdscr_):
 
             # TODO Error gracefully if we don't have all the clues.
 
-            start_time = time.time()
-            solns = solver.solve_puzzle(puzzle)
-            time_to_solve = time.time() - start_time
-            if len(solns) > 0:
-                # XXX
-                dbg.print('Adding the solution:', solns[0])
-                puzzle.add_solution(solns[0])
-                show_status(f'Found a solution in {time_to_solve:.2f}s.')
+            # We look for up to two solutions so we can tell the user if the
+            # solution is unique without enumerating every solution.
+            start_bg_job(
+                    puzzle,
+                    lambda result: show_solve_result(puzzle, result),
+                    max_solutions=2
+            )
+
+        elif key == 'n':              #### n    = Number of solutions
+
+            # Under-clued puzzles can have too many solutions to count, so we
+            # may get an estimate instead.
+            start_bg_job(
+                    puzzle,
+                    show_count_result,
+                    time_limit=solve_time_limit,
+                    task='count'
+            )
 
         elif key == 'e':              #### e    = run Experimental solver.
 
-            solver.print_human_friendly_soln(puzzle)
+            start_bg_job(
+                    puzzle,
+                    lambda result: show_rules_result(puzzle, result),
+                    time_limit=solve_time_limit,
+                    task='rules'
+            )
 
         elif key == 'p':
 
@@ -361,10 +476,25 @@ def main(stdscr_):
 
             else:                     #### \p   = make a pdf incl the soln.
 
-                # Ensure a solution is known.
+                # Ensure a solution is known. If we need to solve the puzzle,
+                # we'll make the pdf once the background solve finishes.
                 if puzzle.solution is None:
-                    show_status('Finding a solution ...')
-                    puzzle.add_solution(solver.solve_puzzle(puzzle)[0])
+                    def when_done(result, filename=filename):
+                        if result['stop_reason'] == 'cancel':
+                            show_status('Solver canceled; no pdf written.')
+                            return
+                        if len(result['solns']) == 0:
+                            show_status('No solution found; no pdf written.')
+                            return
+                        puzzle.add_solution(result['solns'][0])
+                        pdf_filename = make_pdf_using_puzzle_filename(
+                                puzzle,
+                                filename,
+                                does_include_solution = True
+                        )
+                        show_status(f'pdf written to {pdf_filename}')
+                    start_bg_job(puzzle, when_done, max_solutions=1)
+                    continue
                 pdf_filename = make_pdf_using_puzzle_filename(
                         puzzle,
                         filename,
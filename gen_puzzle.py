@@ -0,0 +1,153 @@
+""" gen_puzzle.py
+
+    Functions to generate random puzzles.
+
+    Puzzles from make_random_puzzle() are not curated in any way -- they often
+    have many solutions -- but they are handy as reproducible inputs for timing
+    the solver. make_unique_puzzle() keeps trying until it finds a puzzle with
+    exactly one solution.
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+import random
+
+import search
+import solver
+from puzzle import Puzzle
+
+
+# ______________________________________________________________________
+# Internal functions
+
+def get_random_latin_square(size, rng):
+    """ Return a random size x size latin square as a list of values in reading
+        order, using the values 1, 2, ..., size.
+    """
+
+    # Start with a cyclic square, then shuffle rows, columns, and symbols.
+    rows = list(range(size))
+    cols = list(range(size))
+    syms = list(range(1, size + 1))
+    rng.shuffle(rows)
+    rng.shuffle(cols)
+    rng.shuffle(syms)
+    return [
+            syms[(rows[y] + cols[x]) % size]
+            for y in range(size)
+            for x in range(size)
+    ]
+
+def get_random_group_pts(size, rng, max_group_size, min_group_size=1):
+    """ Return a list of lists of points, each sublist being the points of a
+        connected group. Together the groups cover the whole size x size grid.
+        A group may end up smaller than `min_group_size` if it runs out of
+        free neighbors.
+    """
+
+    unused = {(x, y) for x in range(size) for y in range(size)}
+    groups = []
+    for y in range(size):
+        for x in range(size):
+            if (x, y) not in unused:
+                continue
+            group_size = rng.randint(min_group_size, max_group_size)
+            pts = [(x, y)]
+            unused.remove((x, y))
+            while len(pts) < group_size:
+                nbrs = [
+                        (pt[0] + dx, pt[1] + dy)
+                        for pt in pts
+                        for dx, dy in [(1, 0), (0, 1), (-1, 0), (0, -1)]
+                        if (pt[0] + dx, pt[1] + dy) in unused
+                ]
+                if len(nbrs) == 0:
+                    break
+                nbr = rng.choice(nbrs)
+                pts.append(nbr)
+                unused.remove(nbr)
+            groups.append(pts)
+    return groups
+
+def get_clue(puzzle, nums, rng):
+    """ Return a clue string that is consistent with the group values `nums`.
+    """
+
+    if len(nums) == 1:
+        return str(nums[0])
+
+    ops = [puzzle.add_char, puzzle.mul_char]
+    if len(nums) == 2:
+        ops.append(puzzle.sub_char)
+        if max(nums) % min(nums) == 0:
+            ops.append(puzzle.div_char)
+    op = rng.choice(ops)
+
+    if op == puzzle.add_char:
+        num = sum(nums)
+    elif op == puzzle.mul_char:
+        num = 1
+        for n in nums:
+            num *= n
+    elif op == puzzle.sub_char:
+        num = max(nums) - min(nums)
+    else:
+        num = max(nums) // min(nums)
+    return f'{num}{op}'
+
+
+# ______________________________________________________________________
+# Public functions
+
+def make_random_puzzle(size, seed=0, max_group_size=4, min_group_size=1):
+    """ Return a Puzzle of the given size with random groups and clues that
+        are consistent with a random latin square. The same seed always
+        produces the same puzzle.
+    """
+
+    rng = random.Random(seed)
+    square = get_random_latin_square(size, rng)
+
+    puzzle = Puzzle(size)
+    groups = []
+    group_pts = get_random_group_pts(
+            size,
+            rng,
+            max_group_size,
+            min_group_size
+    )
+    for pts in group_pts:
+        nums = [square[x + size * y] for x, y in pts]
+        groups.append([get_clue(puzzle, nums, rng)] + pts)
+    puzzle.groups = groups
+
+    return puzzle
+
+def make_unique_puzzle(
+        size,
+        seed=0,
+        max_group_size=4,
+        time_limit=10.0,
+        min_group_size=1):
+    """ Return a random Puzzle that has exactly one solution, with that
+        solution stored in puzzle.solution. We try random puzzles until we
+        find one that is unique, so the same seed always produces the same
+        puzzle. Candidates whose uniqueness can't be decided in `time_limit`
+        seconds are skipped.
+    """
+
+    rng = random.Random(seed)
+    while True:
+        puzzle = make_random_puzzle(
+                size,
+                rng.getrandbits(32),
+                max_group_size,
+                min_group_size
+        )
+        budget = search.Budget(time_limit=time_limit)
+        solns = solver.solve_puzzle(puzzle, 'dlx', 2, budget)
+        if solns.is_complete and len(solns) == 1:
+            puzzle.add_solution(solns[0])
+            return puzzle
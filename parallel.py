@@ -0,0 +1,225 @@
+""" parallel.py
+
+    Solve a puzzle using several processes.
+
+    We split the search tree near its root by fixing the values of a few
+    groups. Each way to fill in those groups gives an independent subproblem,
+    which is the original puzzle with those groups replaced by given squares.
+    The subproblems are handed out one at a time to a multiprocessing pool, so
+    that idle workers pick up the next subproblem as soon as they finish.
+
+    The functions here mirror those in solver.py. When we only need a few
+    solutions -- for example, to check uniqueness -- we stop all the workers as
+    soon as we have enough.
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+import multiprocessing
+import os
+
+import partition
+import search
+import solver
+from puzzle import Puzzle
+
+
+# ______________________________________________________________________
+# Globals
+
+# We aim for at least this many subproblems per worker, which gives the pool
+# room to balance the load when some subproblems are much harder than others.
+subproblems_per_worker = 4
+
+# Groups with more placements than this are never used to split the search.
+max_split_placements = 5000
+
+# This is how often, in seconds, the main process checks its budget while it
+# waits for results.
+poll_interval = 0.1
+
+
+# ______________________________________________________________________
+# Internal functions
+
+def get_subproblems(puzzle, num_wanted, budget=None):
+    """ Return a list of puzzles whose solution sets partition the solutions
+        of `puzzle`. We fix groups in order of increasing number of placements
+        until we have at least `num_wanted` subproblems, or run out of groups.
+        If a search.Budget is given, it's checked while we list placements.
+    """
+
+    N = puzzle.size
+
+    # Each candidate is (num_placements, group_idx, placements).
+    candidates = []
+    for i, group in enumerate(puzzle.groups):
+        if puzzle.get_clue(group).op is None or len(group) < 3:
+            continue
+        placements = partition.get_group_placements(
+                puzzle,
+                group,
+                max_split_placements,
+                budget
+        )
+        if placements is not None:
+            candidates.append((len(placements), i, placements))
+    candidates.sort()
+
+    # A partial split is a dict mapping points to values.
+    splits = [{}]
+    fixed_groups = set()
+    for num, i, placements in candidates:
+        if len(splits) >= num_wanted:
+            break
+        pts = puzzle.groups[i][1:]
+        new_splits = []
+        for split in splits:
+            for values in placements:
+                new_split = dict(split)
+                for pt, val in zip(pts, values):
+                    new_split[pt] = val
+                if is_consistent(new_split, N):
+                    new_splits.append(new_split)
+        splits = new_splits
+        fixed_groups.add(i)
+
+    subproblems = []
+    for split in splits:
+        sub = Puzzle(N)
+        sub.groups = [
+                group[:] for i, group in enumerate(puzzle.groups)
+                if i not in fixed_groups
+        ]
+        sub.groups += [[str(val), pt] for pt, val in split.items()]
+        subproblems.append(sub)
+    return subproblems
+
+def is_consistent(split, N):
+    """ Return True if no value repeats in a row or column of `split`. """
+    seen = set()
+    for (x, y), val in split.items():
+        row_key, col_key = ('row', y, val), ('col', x, val)
+        if row_key in seen or col_key in seen:
+            return False
+        seen.add(row_key)
+        seen.add(col_key)
+    return True
+
+def solve_subproblem(args):
+    """ This runs in a worker process. It returns (solns, stats_dict,
+        stop_reason) for one subproblem.
+    """
+    puzzle, engine, max_solutions, deadline = args
+    budget = search.Budget(deadline=deadline)
+    solns = solver.solve_puzzle(puzzle, engine, max_solutions, budget)
+    return list(solns), solns.stats.as_dict(), solns.stop_reason
+
+
+# ______________________________________________________________________
+# Public functions
+
+def iter_solutions(
+        puzzle,
+        engine='propagate',
+        max_solutions=None,
+        budget=None,
+        num_workers=None):
+    """ Yield the solutions to `puzzle`, in the same format as
+        solver.iter_solutions(), using `num_workers` processes. The default is
+        one worker per cpu.
+
+        Solutions arrive one subproblem at a time, so they may come in bursts.
+        The budget's time limit, node limit, and cancellation token are
+        checked by the main process while it waits, and the workers are
+        stopped as soon as the budget runs out or we have `max_solutions`
+        solutions. Counts in budget.stats only include finished subproblems.
+    """
+
+    if budget is None:
+        budget = search.Budget()
+    budget.start()
+
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+
+    if max_solutions is not None and max_solutions <= 0:
+        budget.finish()
+        return
+
+    # A budget may cover several searches, so we count this search's
+    # solutions here rather than relying on budget.stats.num_solns.
+    num_solns = 0
+
+    try:
+        subproblems = get_subproblems(
+                puzzle,
+                num_workers * subproblems_per_worker,
+                budget
+        )
+        args = [
+                (sub, engine, max_solutions, budget.deadline)
+                for sub in subproblems
+        ]
+        with multiprocessing.Pool(num_workers) as pool:
+            results = pool.imap_unordered(solve_subproblem, args, chunksize=1)
+            for _ in range(len(args)):
+                while True:
+                    try:
+                        result = results.next(timeout=poll_interval)
+                        break
+                    except multiprocessing.TimeoutError:
+                        budget.check()
+                solns, stats, stop_reason = result
+                budget.stats.add_counts(stats)
+                if stop_reason is not None:
+                    budget.stop(stop_reason)
+                for soln in solns:
+                    num_solns += 1
+                    budget.stats.num_solns += 1
+                    yield soln
+                    if num_solns == max_solutions:
+                        return
+                budget.check()
+            # Leaving the `with` block terminates any workers still running.
+    except search.SearchStopped:
+        pass
+    finally:
+        budget.finish()
+
+def solve_puzzle(
+        puzzle,
+        engine='propagate',
+        max_solutions=None,
+        budget=None,
+        num_workers=None):
+    """ This is the parallel version of solver.solve_puzzle(). It returns a
+        search.SolveResult.
+    """
+    if budget is None:
+        budget = search.Budget()
+    solns = iter_solutions(puzzle, engine, max_solutions, budget, num_workers)
+    return search.SolveResult(solns, budget, engine)
+
+def count_solutions(
+        puzzle,
+        limit=2,
+        engine='propagate',
+        budget=None,
+        num_workers=None):
+    """ This is the parallel version of solver.count_solutions(). """
+    num_solns = 0
+    for soln in iter_solutions(puzzle, engine, limit, budget, num_workers):
+        num_solns += 1
+    return num_solns
+
+def is_unique(puzzle, engine='propagate', budget=None, num_workers=None):
+    """ This is the parallel version of solver.is_unique(). """
+    if budget is None:
+        budget = search.Budget()
+    num_solns = count_solutions(puzzle, 2, engine, budget, num_workers)
+    if num_solns < 2 and budget.stop_reason is not None:
+        return None
+    return num_solns == 1
@@ -1,60 +1,203 @@
 """ partition.py
 
     Functions to help determine which values can be valid in a given puzzle.
+
+    The add and mul partitions are slow to list from scratch, and the editor
+    and solvers ask for the same ones over and over, so we keep the most
+    recently used results in an LRU cache. We also ship a precomputed table,
+    partition_table.json, of every add and mul partition for puzzles up to
+    9x9 and groups of up to 6 squares. It's loaded the first time it's
+    needed. If it's missing, we simply compute every partition on demand. Run
+    this file as a script to rebuild the table:
+
+        python3 partition.py
 """
 
 
 # ______________________________________________________________________
 # Imports
 
+import json
+import os
 from collections import Counter
-from functools import reduce
+from functools import lru_cache, reduce
+from math import factorial
 from operator import add, mul
 
+import shapes
 from alg_b import algorithm_b
+from puzzle import Op
+
+
+# ______________________________________________________________________
+# Globals
+
+# This is the number of distinct partition queries we remember.
+cache_size = 4096
+
+table_filename = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        'partition_table.json'
+)
+
+# The table covers puzzles and groups up to these sizes.
+table_max_size = 9
+table_max_group_size = 6
+
+# This is set to the loaded table, or False if it couldn't be loaded.
+# table[op_name][num_sq][clue_num] is the list of partitions using values
+# 1..table_max_size, with no limit on repeats.
+table = None
+
+op_names = {add: 'add', mul: 'mul'}
 
 
 # ______________________________________________________________________
 # Internal functions
 
-def get_addmul_partitions(hi,clue_num, num_sq, max_repeat, op):
+def get_addmul_partitions(hi, clue_num, num_sq, max_repeat, op):
     """ Return a list of lists, each sublist containing num_sq elements with
         their sum or product (based on op == add or op == mul) being equal to
         clue_num. The sublists also meet the requirement that the most common
         element occurs at most max_repeat times.
+
+        Each sublist is sorted, and the sublists are in lexicographic order.
     """
-    def is_good(x, ell):
 
-        if sorted(x[:ell]) != x[:ell]:
-            return False
+    # We build each sublist x from left to right as a non-decreasing
+    # sequence, keeping the part of clue_num that's still needed (`rest`)
+    # and the length of the run of values equal to the last one (`repeat`).
+    # Since every later value is at least x[i] and at most hi, we know the
+    # least and greatest total the remaining values can reach, and we only
+    # try values of x[i] that keep `rest` within those bounds. For products,
+    # we also only try values that divide `rest`.
 
-        repeat = Counter(x[:ell]).most_common(1)[0][1]
-        if repeat > max_repeat:
-            return False
+    parts = []
+    x = [0] * num_sq
 
-        val = reduce(op, x[:ell])
+    def add_rest(i, rest, repeat):
+        num_left = num_sq - i
+        if num_left == 0:
+            if rest == 0:
+                parts.append(x[:])
+            return
+        lo = x[i - 1] if i > 0 else 1
+        lo = max(lo, rest - (num_left - 1) * hi)
+        for v in range(lo, min(hi, rest // num_left) + 1):
+            run = repeat + 1 if i > 0 and v == x[i - 1] else 1
+            if run > max_repeat:
+                continue
+            x[i] = v
+            add_rest(i + 1, rest - v, run)
 
-        if ell == num_sq:
-            return val == clue_num
+    def mul_rest(i, rest, repeat):
+        num_left = num_sq - i
+        if num_left == 0:
+            if rest == 1:
+                parts.append(x[:])
+            return
+        lo = x[i - 1] if i > 0 else 1
+        max_rest = hi ** (num_left - 1)
+        for v in range(lo, hi + 1):
+            if v ** num_left > rest:
+                break
+            if rest % v or rest > v * max_rest:
+                continue
+            run = repeat + 1 if i > 0 and v == x[i - 1] else 1
+            if run > max_repeat:
+                continue
+            x[i] = v
+            mul_rest(i + 1, rest // v, run)
 
-        if op == add:
-            return val < clue_num
-        else:
-            return val <= clue_num
+    if clue_num > 0 and num_sq > 0:
+        (add_rest if op == add else mul_rest)(0, clue_num, 0)
+    return parts
 
-    x = [0] * num_sq
-    D = [list(range(1, hi + 1))] * num_sq
-    return [x[:] for x in algorithm_b(x, D, is_good)]
+def get_table():
+    """ Return the partition table, loading it if needed, or return None if
+        it's not available.
+    """
+    global table
+    if table is None:
+        try:
+            with open(table_filename) as f:
+                data = json.load(f)
+            table = {
+                    op_name: {
+                        int(num_sq): {
+                            int(clue_num): parts
+                            for clue_num, parts in by_clue.items()
+                        }
+                        for num_sq, by_clue in by_size.items()
+                    }
+                    for op_name, by_size in data['partitions'].items()
+            }
+        except (OSError, ValueError, KeyError):
+            table = False
+    return table or None
+
+@lru_cache(maxsize=cache_size)
+def get_cached_partitions(hi, clue_num, num_sq, max_repeat, op):
+    """ This is a memoized version of get_addmul_partitions() that returns
+        a tuple of tuples. It uses the partition table when it can.
+    """
+
+    table = get_table()
+    if table and hi <= table_max_size and num_sq <= table_max_group_size:
+        parts = table[op_names[op]][num_sq].get(clue_num, [])
+        return tuple(
+                tuple(part) for part in parts
+                if part[-1] <= hi and
+                   Counter(part).most_common(1)[0][1] <= max_repeat
+        )
+
+    parts = get_addmul_partitions(hi, clue_num, num_sq, max_repeat, op)
+    return tuple(tuple(part) for part in parts)
+
+def get_num_orders(parts):
+    """ Return the total number of distinct orderings of the lists in `parts`.
+        This is an upper bound on the number of ways to place them in a group.
+    """
+    num = 0
+    for part in parts:
+        num_orders = factorial(len(part))
+        for count in Counter(part).values():
+            num_orders //= factorial(count)
+        num += num_orders
+    return num
+
+def make_partition_table():
+    """ Write every add and mul partition within the table limits to
+        table_filename.
+    """
+
+    hi = table_max_size
+    data = {'add': {}, 'mul': {}}
+    for op, op_name in op_names.items():
+        for num_sq in range(1, table_max_group_size + 1):
+            by_clue = {}
+            x = [0] * num_sq
+            D = [list(range(1, hi + 1))] * num_sq
+            is_sorted = lambda x, ell: ell < 2 or x[ell - 2] <= x[ell - 1]
+            for part in algorithm_b(x, D, is_sorted):
+                clue_num = reduce(op, part)
+                by_clue.setdefault(clue_num, []).append(part[:])
+            data[op_name][num_sq] = by_clue
+
+    with open(table_filename, 'w') as f:
+        json.dump({'format_version': 1, 'partitions': data}, f)
 
 
 # ______________________________________________________________________
 # Public functions
 
 def get_add_partitions(hi, clue_num, num_sq, max_repeat):
-    return get_addmul_partitions(hi, clue_num, num_sq, max_repeat, add)
+    parts = get_cached_partitions(hi, clue_num, num_sq, max_repeat, add)
+    return [list(part) for part in parts]
 
 def get_mul_partitions(hi, clue_num, num_sq, max_repeat):
-    return get_addmul_partitions(hi, clue_num, num_sq, max_repeat, mul)
+    parts = get_cached_partitions(hi, clue_num, num_sq, max_repeat, mul)
+    return [list(part) for part in parts]
 
 def get_sub_partitions(hi, clue_num, num_sq=None, max_repeat=None):
     return [
@@ -67,3 +210,86 @@ def get_div_partitions(hi, clue_num, num_sq=None, max_repeat=None):
             [a, a * clue_num]
             for a in range(1, hi // clue_num + 1)
     ]
+
+
+# ______________________________________________________________________
+# Public functions that work with puzzle groups
+
+def get_group_partitions(puzzle, group, budget=None):
+    """ Return the list of partitions -- sorted lists of values -- that could
+        fill `group` based on its clue and its shape. A group with a given
+        value has the single partition [value]. If a search.Budget is given,
+        it's checked while we look at the group's shape.
+    """
+
+    clue = puzzle.get_clue(group)
+    num_sq = len(group) - 1
+
+    if clue.op is None:
+        raise ValueError(f'This group has no valid clue: {group!r}')
+    if clue.op == Op.GIVEN:
+        return [[clue.num]]
+
+    part_fn_map = {
+            Op.ADD: get_add_partitions,
+            Op.SUB: get_sub_partitions,
+            Op.MUL: get_mul_partitions,
+            Op.DIV: get_div_partitions
+    }
+
+    # The max_repeat limit is a quick first pass; shapes.can_hold() then
+    # drops the partitions that the group's shape can't actually hold.
+    group_w = len({pt[0] for pt in group[1:]})
+    group_h = len({pt[1] for pt in group[1:]})
+    max_repeat = min(group_w, group_h)
+    parts = part_fn_map[clue.op](
+            puzzle.size,
+            clue.num,
+            num_sq,
+            max_repeat
+    )
+    check = budget.check if budget else None
+    return [
+            part for part in parts
+            if shapes.can_hold(group[1:], part, puzzle.size, check)
+    ]
+
+def get_group_placements(puzzle, group, max_num=None, budget=None):
+    """ Return a list of tuples, each tuple holding values for the points
+        group[1:], in that order. These are all the ways to fill in the group
+        so that the clue is met and no value repeats within a row or column.
+
+        If `max_num` is given and there are more than `max_num` placements,
+        then None is returned instead. This check is made before the
+        placements are listed, so it's a quick way to skip very large groups.
+        If a search.Budget is given, it's checked while the placements are
+        counted and listed.
+    """
+
+    pts = group[1:]
+    N = puzzle.size
+    check = budget.check if budget else None
+    parts = get_group_partitions(puzzle, group, budget)
+
+    # We first try the number of distinct orders of each partition, which is
+    # an upper bound that's quick to find, and only count exactly if needed.
+    if max_num is not None and get_num_orders(parts) > max_num:
+        num = sum(
+                shapes.count_placements(pts, part, N, check)
+                for part in parts
+        )
+        if num > max_num:
+            return None
+
+    placements = []
+    for part in parts:
+        placements.extend(sorted(shapes.get_placements(pts, part, N, check)))
+    return placements
+
+
+# ______________________________________________________________________
+# Main
+
+if __name__ == '__main__':
+    make_partition_table()
+    print('Wrote', table_filename)
@@ -9,6 +9,8 @@
 
 import fpdf
 
+from puzzle import char_of_op
+
 
 # ______________________________________________________________________
 # Internal functions
@@ -106,12 +108,12 @@ def make_pdf(puzzle, filename, do_include_solution=False):
                 x0 + clue_pt[0] * lane_width,
                 y0 + clue_pt[1] * lane_width
         )
-        if len(clue) == 0:
+        if clue == '':
             continue
-        if clue[-1] in puzzle.op_chars:
-            prefix, suffix = clue[:-1], clue[-1]
-        else:
-            prefix, suffix = clue, ''
+        prefix, suffix = clue, ''
+        parsed = puzzle.get_clue(group)
+        if parsed.op in char_of_op:
+            prefix, suffix = str(parsed.num), char_of_op[parsed.op]
         pdf.set_font('NotoSans', 'B', 7)
         w = pdf.get_string_width(prefix)
         pdf.cell(w + 0.01, 4.12, prefix)
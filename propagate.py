@@ -0,0 +1,384 @@
+""" propagate.py
+
+    A constraint-propagation solver engine.
+
+    Each square's set of candidate values is stored as an int bitmask, where
+    bit v is set when v is still possible. After each assignment, we propagate
+    the consequences -- row/column all-different and the group clues -- until
+    nothing else changes, and then we branch on the square with the fewest
+    remaining candidates.
+
+    Each group is handled as a table constraint: we list every placement of
+    values that meets its clue (see partition.get_group_placements()), and
+    keep only the placements that are compatible with the current domains.
+    This is simple tabular reduction, and it keeps each group generalized arc
+    consistent: every value left in a square's domain appears in some
+    remaining placement. Groups with too many placements fall back to
+    reasoning about the bounds of sums and products.
+
+    We also use the sums and products of whole lines: combined with the
+    clues, these tell us the sum or product of some small sets of squares
+    (see totals.py), which we narrow with the same bounds reasoning.
+
+    The main function is iter_solns(), which yields solutions in the same
+    format as solver.solve_puzzle().
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+from functools import reduce
+from operator import add, mul, or_
+
+import partition
+import search
+import totals
+from puzzle import Op
+
+
+# ______________________________________________________________________
+# Globals
+
+# Groups with more than this many placements use bounds reasoning instead of
+# a table constraint.
+max_table_size = 20000
+
+# We only use line totals that cover at most this many squares; the bounds
+# of larger sums and products rarely tell us anything.
+max_total_sqrs = 4
+
+
+# ______________________________________________________________________
+# Classes
+
+class Model(object):
+    """ A Model holds the puzzle information in the form needed by the search:
+        squares are indexed in reading order (x + size * y), and each clued
+        group becomes a (op, clue_num, sqrs) tuple, where `op` is a
+        puzzle.Op.
+
+        The search state is a pair (doms, tables). doms[sqr] is the bitmask of
+        candidates for square sqr, and tables[g] is the list of placements
+        still possible for group g, or None for groups that use bounds
+        reasoning. A placement is a tuple of single-bit masks, one per square
+        of the group.
+
+        Line totals are in self.totals as (op, total, sqrs) tuples, where `op`
+        is operator.add or operator.mul; see totals.py.
+    """
+
+    def __init__(
+            self,
+            puzzle,
+            use_tables=True,
+            budget=None,
+            use_totals=True):
+
+        N = puzzle.size
+        self.puzzle = puzzle
+        self.stats = (budget or search.Budget()).stats
+        self.prune_reason = None
+        self.size = N
+        self.full = ((1 << N) - 1) << 1  # Bits 1..N are set.
+
+        self.lines = (
+                [[x + N * y for x in range(N)] for y in range(N)] +  # Rows.
+                [[x + N * y for y in range(N)] for x in range(N)]    # Cols.
+        )
+        self.peers = [
+                [j for j in self.lines[i // N] + self.lines[N + i % N]
+                 if j != i]
+                for i in range(N * N)
+        ]
+
+        # num_bits[mask] = the number of set bits in mask.
+        self.num_bits = [bin(mask).count('1') for mask in range(1 << (N + 1))]
+
+        self.grp_of_sqr = [-1] * (N * N)
+        self.groups = []
+        self.grp_why = []  # The prune reason per group; see search.SearchStats.
+        self.init_tables = []
+        # Groups without a clue (eg, while editing) don't constrain squares.
+        for g, (group, clue) in enumerate(puzzle.get_clued_groups()):
+            sqrs = [x + N * y for x, y in group[1:]]
+            for sqr in sqrs:
+                self.grp_of_sqr[sqr] = g
+            if clue.op == Op.GIVEN:
+                assert len(sqrs) == 1
+            self.groups.append((clue.op, clue.num, sqrs))
+            self.grp_why.append(clue.op.value)
+            table = None
+            if use_tables:
+                # Building large tables can take a while, so we honor the
+                # budget here as well as during the search.
+                if budget:
+                    budget.check()
+                placements = partition.get_group_placements(
+                        puzzle,
+                        group,
+                        max_table_size,
+                        budget
+                )
+                if placements is not None:
+                    table = [
+                            tuple(1 << v for v in values)
+                            for values in placements
+                    ]
+            self.init_tables.append(table)
+
+        self.totals = []
+        self.totals_of_sqr = [[] for _ in range(N * N)]
+        if use_totals:
+            self.add_line_totals(puzzle, budget)
+
+    def add_line_totals(self, puzzle, budget=None):
+        """ Set up self.totals and self.totals_of_sqr. """
+
+        N = self.size
+        all_parts = [
+                partition.get_group_partitions(puzzle, group, budget)
+                if puzzle.get_clue(group).op is not None else None
+                for group in puzzle.groups
+        ]
+        for op in [add, mul]:
+            grp_totals = [
+                    totals.get_grp_total(parts, op) if parts else None
+                    for parts in all_parts
+            ]
+            line_totals = totals.get_line_totals(
+                    puzzle,
+                    grp_totals,
+                    op,
+                    max_total_sqrs
+            )
+            for name, kind, total, pts in line_totals:
+                t = len(self.totals)
+                sqrs = [x + N * y for x, y in pts]
+                self.totals.append((op, total, sqrs))
+                for sqr in sqrs:
+                    self.totals_of_sqr[sqr].append(t)
+
+    def get_initial_state(self):
+        """ Return the starting (doms, tables) pair, or None if the puzzle is
+            already known to be contradictory.
+        """
+        doms = [self.full] * (self.size ** 2)
+        for op, clue_num, sqrs in self.groups:
+            if op == Op.GIVEN:
+                doms[sqrs[0]] &= (1 << clue_num)
+        tables = self.init_tables[:]
+        if not self.propagate(doms, tables, list(range(len(doms)))):
+            return None
+        return doms, tables
+
+    def revise_group(self, doms, tables, g):
+        """ Narrow the domains of group g's squares based on its clue. This
+            returns the list of squares whose domains shrank, or None if some
+            domain became empty.
+        """
+
+        op, clue_num, sqrs = self.groups[g]
+
+        new_doms = [doms[sqr] for sqr in sqrs]
+
+        if tables[g] is not None:
+            table = tables[g]
+            new_table = [
+                    placement for placement in table
+                    if all(b & d for b, d in zip(placement, new_doms))
+            ]
+            if len(new_table) == 0:
+                return None
+            if len(new_table) < len(table):
+                tables[g] = new_table
+            new_doms = [
+                    d & reduce(or_, bits)
+                    for d, bits in zip(new_doms, zip(*new_table))
+            ]
+
+        elif op == Op.GIVEN:
+            return []
+
+        elif op == Op.ADD or op == Op.MUL:
+            new_doms = totals.narrow_to_total(
+                    new_doms,
+                    add if op == Op.ADD else mul,
+                    clue_num
+            )
+
+        elif op == Op.SUB:
+            a, b = new_doms
+            new_doms[0] = a & ((b << clue_num) | (b >> clue_num))
+            new_doms[1] = b & ((a << clue_num) | (a >> clue_num))
+
+        elif op == Op.DIV:
+            for k in [0, 1]:
+                d, other = new_doms[k], new_doms[1 - k]
+                for v in range(1, self.size + 1):
+                    if not d & (1 << v):
+                        continue
+                    up = v * clue_num
+                    down = v // clue_num if v % clue_num == 0 else 0
+                    if not ((up <= self.size and other & (1 << up)) or
+                            (down > 0 and other & (1 << down))):
+                        d &= ~(1 << v)
+                new_doms[k] = d
+
+        return self.get_changes(doms, sqrs, new_doms)
+
+    def revise_total(self, doms, t):
+        """ Narrow the domains of the squares in line total t. This returns the
+            list of squares whose domains shrank, or None if some domain became
+            empty.
+        """
+        op, total, sqrs = self.totals[t]
+        new_doms = totals.narrow_to_total(
+                [doms[sqr] for sqr in sqrs],
+                op,
+                total
+        )
+        return self.get_changes(doms, sqrs, new_doms)
+
+    def get_changes(self, doms, sqrs, new_doms):
+        """ Copy new_doms into the domains of `sqrs`, and return the list of
+            squares whose domains shrank, or None if some domain is empty.
+        """
+        changed = []
+        for sqr, d in zip(sqrs, new_doms):
+            if d == 0:
+                return None
+            if d != doms[sqr]:
+                doms[sqr] = d
+                changed.append(sqr)
+        return changed
+
+    def propagate(self, doms, tables, queue):
+        """ Propagate constraints from the squares in `queue`, whose domains
+            have changed, until we reach a fixed point. This modifies `doms` in
+            place and returns False if we find a contradiction, in which case
+            self.prune_reason says which constraint failed.
+        """
+
+        N = self.size
+        num_bits = self.num_bits
+        stats = self.stats
+
+        while queue:
+
+            while queue:
+                sqr = queue.pop()
+                d = doms[sqr]
+
+                # An assigned square removes its value from its peers.
+                if num_bits[d] == 1:
+                    for peer in self.peers[sqr]:
+                        if doms[peer] & d:
+                            doms[peer] &= ~d
+                            if doms[peer] == 0:
+                                same_row = (peer // N == sqr // N)
+                                return self.fail('row' if same_row else 'col')
+                            queue.append(peer)
+
+                g = self.grp_of_sqr[sqr]
+                if g != -1:
+                    stats.num_props += 1
+                    changed = self.revise_group(doms, tables, g)
+                    if changed is None:
+                        return self.fail(self.grp_why[g])
+                    queue.extend(changed)
+
+                for t in self.totals_of_sqr[sqr]:
+                    stats.num_props += 1
+                    changed = self.revise_total(doms, t)
+                    if changed is None:
+                        return self.fail('total')
+                    queue.extend(changed)
+
+            # Look for values that have only one place left in a line.
+            stats.num_props += 1
+            for i, line in enumerate(self.lines):
+                seen_once, seen_twice = 0, 0
+                for sqr in line:
+                    seen_twice |= seen_once & doms[sqr]
+                    seen_once  |= doms[sqr]
+                if seen_once != self.full:
+                    return self.fail('row' if i < N else 'col')
+                singles = seen_once & ~seen_twice
+                if singles == 0:
+                    continue
+                for sqr in line:
+                    d = doms[sqr] & singles
+                    if d and doms[sqr] != d:
+                        if num_bits[d] > 1:
+                            return self.fail('row' if i < N else 'col')
+                        doms[sqr] = d
+                        queue.append(sqr)
+
+        return True
+
+    def fail(self, reason):
+        """ Note a contradiction found by propagate(), and return False. """
+        self.prune_reason = reason
+        self.stats.prunes[reason] += 1
+        return False
+
+    def search(self, doms, tables, budget, depth=0):
+        """ Yield each solution reachable from the state (doms, tables), as a
+            list of ints. This calls budget.tick() at each node.
+        """
+
+        budget.tick()
+        stats = budget.stats
+        if depth > stats.max_depth:
+            stats.max_depth = depth
+
+        num_bits = self.num_bits
+
+        # Choose the unassigned square with the fewest remaining candidates.
+        best, best_num = -1, self.size + 1
+        for sqr, d in enumerate(doms):
+            n = num_bits[d]
+            if 1 < n < best_num:
+                best, best_num = sqr, n
+                if n == 2:
+                    break
+
+        if best == -1:
+            yield [d.bit_length() - 1 for d in doms]
+            return
+
+        N = self.size
+        d = doms[best]
+        while d:
+            bit = d & -d
+            d &= ~bit
+            new_doms = doms[:]
+            new_doms[best] = bit
+            new_tables = tables[:]
+            with budget.phase('propagate'):
+                is_ok = self.propagate(new_doms, new_tables, [best])
+            if budget.trace is not None:
+                choice = [((best % N, best // N), bit.bit_length() - 1)]
+                reason = None if is_ok else self.prune_reason
+                budget.trace(depth + 1, choice, reason)
+            if is_ok:
+                yield from self.search(new_doms, new_tables, budget, depth + 1)
+                stats.num_backtracks += 1
+
+
+# ______________________________________________________________________
+# Public functions
+
+def iter_solns(puzzle, budget=None, use_tables=True, use_totals=True):
+    """ Yield each solution of `puzzle` as a list of numbers in reading order.
+        If `use_tables` is False, all groups use bounds reasoning. If
+        `use_totals` is False, we don't use line totals.
+    """
+    if budget is None:
+        budget = search.Budget()
+    with budget.phase('setup'):
+        model = Model(puzzle, use_tables, budget, use_totals)
+        state = model.get_initial_state()
+    if state is not None:
+        yield from model.search(*state, budget)
@@ -8,8 +8,10 @@
 # Imports
 
 import curses
+import enum
 import json
 import math
+from functools import lru_cache
 
 import drawing
 
@@ -22,6 +24,91 @@ GROUP_HIGHLIGHT = 2
 BACKGROUND      = 3
 CLUE            = 4
 
+# These are the official op characters, used in .kk files and on screen.
+add_char = '+'
+sub_char = '–'
+mul_char = '×'
+div_char = '÷'
+
+
+# ______________________________________________________________________
+# Clues
+
+class Op(enum.Enum):
+    """ The kind of a clue. The values are also the prune reasons used in
+        search.SearchStats.
+    """
+    ADD   = 'add'
+    SUB   = 'sub'
+    MUL   = 'mul'
+    DIV   = 'div'
+    GIVEN = 'given'
+
+# This maps each op character, including the ASCII ones people tend to type,
+# to its Op.
+op_of_char = {
+        add_char: Op.ADD,
+        sub_char: Op.SUB,
+        mul_char: Op.MUL,
+        div_char: Op.DIV,
+        '-'     : Op.SUB,
+        'x'     : Op.MUL,
+        '*'     : Op.MUL,
+        '/'     : Op.DIV
+}
+
+char_of_op = {
+        Op.ADD: add_char,
+        Op.SUB: sub_char,
+        Op.MUL: mul_char,
+        Op.DIV: div_char
+}
+
+class Clue(object):
+    """ A parsed clue string.
+
+        `op` is an Op, or None if the clue is empty or invalid. `num` is the
+        clue's integer target, or the value of a given square, or None if
+        `op` is None. `is_valid` is False when `text` isn't a clue we
+        understand; an empty clue is valid, and simply says nothing about its
+        group yet. `text` is the clue string as stored in the puzzle.
+
+        str(clue) is the clue written with the official op characters.
+    """
+
+    def __init__(self, text, op=None, num=None, is_valid=True):
+        self.text     = text
+        self.op       = op
+        self.num      = num
+        self.is_valid = is_valid
+
+    def __str__(self):
+        if self.op is None:
+            return self.text
+        if self.op == Op.GIVEN:
+            return str(self.num)
+        return f'{self.num}{char_of_op[self.op]}'
+
+    def __repr__(self):
+        return f'Clue({self.text!r})'
+
+@lru_cache(maxsize=None)
+def parse_clue(text):
+    """ Return the Clue for the string `text`. Clues are parsed once per
+        distinct string, so callers can parse freely. The results are shared,
+        so callers shouldn't change them.
+    """
+
+    if text == '':
+        return Clue(text)
+
+    op = op_of_char.get(text[-1])
+    num_str = text if op is None else text[:-1]
+    if not (num_str.isascii() and num_str.isdigit()) or int(num_str) == 0:
+        return Clue(text, is_valid=False)
+
+    return Clue(text, op or Op.GIVEN, int(num_str))
+
 
 # ______________________________________________________________________
 # Main class
@@ -32,49 +119,85 @@ class Puzzle(object):
     # Constructor
 
     def __init__(self, size=4):
+        self.size = size
         # Each group has the form [<clue_str>, <pt1>, <pt2>, <pt3>, ... ].
-        # Some points may be in no groups (for new/partial puzzles).
+        # Some points may be in no groups (for new/partial puzzles). Setting
+        # self.groups also sets up self.grp_idx; see update_group_index().
         self.groups = []
-        self.size = size
         self.solution = None
 
+        # This increases every time the groups, clues, or size change. It lets
+        # us recognize results computed for an older version of the puzzle.
+        self.version = 0
+
         self.x_stride = 11
         self.y_stride = 5
 
         # These are convenient to have around.
-        self.add_char = '+'
-        self.sub_char = '–'
-        self.mul_char = '×'
-        self.div_char = '÷'
-        self.op_chars = ''.join([
-            self.add_char,
-            self.sub_char,
-            self.mul_char,
-            self.div_char
-        ])
+        self.add_char = add_char
+        self.sub_char = sub_char
+        self.mul_char = mul_char
+        self.div_char = div_char
+        # Clues are parsed with parse_clue(); see get_clue().
 
         # I am considering allowing self.cursor == None, which would indicate
         # we're in a display-only mode. This might be interesting for simply
         # viewing a puzzle (like `cat FILE`), or printing a puzzle.
         self.cursor = [0, 0]
 
-        # The format here is (index, foreground, background).
-        curses.init_pair(GROUP_HIGHLIGHT, 246, 234)
-        curses.init_pair(BACKGROUND, 7, 16)
-        curses.init_pair(CLUE, 241, 16)
-
+        # We wait until the first draw() call to set up curses colors so that
+        # puzzles can also be loaded and solved without a terminal.
         self.has_draw_been_called = False
 
+    # __________________________________________________________________
+    # The group index
+
+    @property
+    def groups(self):
+        return self._groups
+
+    @groups.setter
+    def groups(self, groups):
+        self._groups = groups
+        self.update_group_index()
+
+    def update_group_index(self):
+        """ Rebuild self.grp_idx, which maps each square, in reading order, to
+            the index of its group in self.groups, or to -1 if the square is
+            in no group. So the squares of the group with index i are
+            self.groups[i][1:].
+
+            The methods that change the groups call this for us, as does
+            assigning a new list to self.groups. Code that changes the group
+            lists in some other way should call this afterwards.
+        """
+        N = self.size
+        self.grp_idx = [-1] * (N * N)
+        for i, group in enumerate(self._groups):
+            for x, y in group[1:]:
+                self.grp_idx[x + N * y] = i
+
+    def get_group_idx(self, pt):
+        """ Return the index in self.groups of the group holding `pt`, or -1
+            if `pt` is in no group or is off the grid.
+        """
+        x, y = pt
+        N = self.size
+        if 0 <= x < N and 0 <= y < N:
+            return self.grp_idx[x + N * y]
+        return -1
+
     # __________________________________________________________________
     # Methods to modify the puzzle
 
     # I'm calling this "reset" rather than "set" because it involves potentially
     # throwing away quite a bit of data.
     def reset_size(self, new_size):
-        if new_size < self.size:
-            self.groups = []
+        groups = [] if new_size < self.size else self.groups
         self.size = new_size
+        self.groups = groups
         self.cursor = [0, 0]
+        self.version += 1
 
     def toggle_join(self, a, b):
         """ If points a and b are already joined, this splits them.
@@ -100,10 +223,13 @@ class Puzzle(object):
         if not self.are_grouped(a, b):
             return
 
-        orig_group = [g for g in self.groups if a in g][0]
+        self.version += 1
+
+        orig_group = self.groups[self.get_group_idx(a)]
 
         if len(self.find_all_paths(a, b, orig_group)) > 1:
             orig_group.remove(b)
+            self.update_group_index()
             return
 
         # We drop any clue from the old group being split.
@@ -129,6 +255,7 @@ class Puzzle(object):
         self.groups.remove(orig_group)
         if len(new_a_group) > 2: self.groups.append(new_a_group)
         if len(new_b_group) > 2: self.groups.append(new_b_group)
+        self.update_group_index()
 
     def join(self, a, b):
         """ This joins the group including point a with the group including
@@ -139,36 +266,64 @@ class Puzzle(object):
         a = tuple(a)
         b = tuple(b)
 
+        self.version += 1
+
         # TODO: Once I'm confident, remove debugging prints.
 
         dbgpr('Merging', a, 'and', b)
 
-        a_group = [(i, g) for i, g in enumerate(self.groups) if a in g]
-        b_group = [(i, g) for i, g in enumerate(self.groups) if b in g]
+        a_idx = self.get_group_idx(a)
+        b_idx = self.get_group_idx(b)
 
-        dbgpr('a_group:', a_group)
-        dbgpr('b_group:', b_group)
+        dbgpr('a_idx:', a_idx)
+        dbgpr('b_idx:', b_idx)
 
-        if a_group and b_group:
+        if a_idx != -1 and b_idx != -1:
             dbgpr('Clause 1')
-            a_group[0][1].extend(b_group[0][1][1:])  # [1:] to skip b's clue.
-            del self.groups[b_group[0][0]]
-        elif a_group or b_group:
+            # [1:] to skip b's clue.
+            self.groups[a_idx].extend(self.groups[b_idx][1:])
+            del self.groups[b_idx]
+        elif a_idx != -1 or b_idx != -1:
             dbgpr('Clause 2')
-            grp = a_group[0][1] if a_group else b_group[0][1]
+            grp = self.groups[a_idx if a_idx != -1 else b_idx]
             if a not in grp: grp.append(a)
             if b not in grp: grp.append(b)
         else:
             dbgpr('Clause 3')
             self.groups.append(['', a, b])
 
+        self.update_group_index()
+
     def set_clue_at_cursor(self, clue):
         group = self.get_group_at_cursor()
         group[0] = clue
+        self.version += 1
 
     def add_solution(self, soln):
         self.solution = soln
 
+    # __________________________________________________________________
+    # Clue methods
+
+    def get_clue(self, group):
+        """ Return the parsed Clue of `group`. """
+        return parse_clue(group[0])
+
+    def get_clued_groups(self):
+        """ Return a list of (group, clue) pairs, one for each group with a
+            clue, in the order of self.groups. Groups without a clue (eg,
+            while editing) are skipped. This raises a ValueError if any clue
+            is invalid.
+        """
+        clued_groups = []
+        for group in self.groups:
+            clue = parse_clue(group[0])
+            if not clue.is_valid:
+                raise ValueError(f'Invalid clue: {group[0]!r}')
+            if clue.op is not None:
+                clued_groups.append((group, clue))
+        return clued_groups
+
     # __________________________________________________________________
     # Utility methods
 
@@ -209,15 +364,15 @@ class Puzzle(object):
             Otherwise, this creates a new group with the contents
             ['', <pt>], appends this group to self.groups, and returns
             the new group. """
-        groups = [g for g in self.groups if tuple(pt) in g]
-        assert len(groups) < 2
-
-        if len(groups) > 0:
-            return groups[0]
+        i = self.get_group_idx(pt)
+        if i != -1:
+            return self.groups[i]
 
         # We need to create a new group.
         group = ['', tuple(pt)]
         self.groups.append(group)
+        x, y = pt
+        self.grp_idx[x + self.size * y] = len(self.groups) - 1
         return group
 
     def get_group_at_cursor(self):
@@ -241,7 +396,7 @@ class Puzzle(object):
         paths = []
         for dir_ in dirs:
             next_ = tuple(start[i] + dir_[i] for i in [0, 1])
-            if next_ not in group or next_ in exclude:
+            if next_ not in pt_set or next_ in exclude:
                 continue
             new_exclude = exclude | {start}
             path_ends = self.find_all_paths(next_, end, group, new_exclude)
@@ -250,11 +405,8 @@ class Puzzle(object):
         return paths
 
     def are_grouped(self, a, b):
-        a_group = [(i, g) for i, g in enumerate(self.groups) if a in g]
-        b_group = [(i, g) for i, g in enumerate(self.groups) if b in g]
-        if not a_group or not b_group:
-            return False
-        return a_group[0][0] == b_group[0][0]
+        a_idx = self.get_group_idx(a)
+        return a_idx != -1 and a_idx == self.get_group_idx(b)
 
     def get_clue_point(self, group):
         """ Return the point in group that ought to include the clue.
@@ -282,9 +434,9 @@ class Puzzle(object):
 
         # Find the first square of the current group, in English reading order.
         # We'll jump the cursor to that square.
-        groups = [g for g in self.groups if tuple(self.cursor) in g]
-        if len(groups) > 0:
-            group = groups[0]
+        i = self.get_group_idx(self.cursor)
+        if i != -1:
+            group = self.groups[i]
             self.cursor = list(self.get_clue_point(group))
             self.draw(stdscr, self.x0, self.y0)
             stdscr.refresh()
@@ -315,33 +467,29 @@ class Puzzle(object):
         )
         if clue is None or clue == '':
             return
-        # TODO: Pull the official op characters out into constants that are
-        #       shared across files. Currently this one and solver.py.
-        op_mapping = {
-                '+': self.add_char,
-                '-': self.sub_char,
-                'x': self.mul_char,
-                '*': self.mul_char,
-                '/': self.div_char
-        }
-        if clue[-1] in op_mapping:
-            clue = clue[:-1] + op_mapping[clue[-1]]
-        # TODO: Check if clue strings are valid. If not, we can highlight
-        #       them in red so users can correct them.
+        # This replaces any ASCII op character with the official one.
+        clue = str(parse_clue(clue))
+        # TODO: Use parse_clue(clue).is_valid to highlight invalid clues in
+        #       red so users can correct them.
         self.set_clue_at_cursor(clue)
         return final_char
 
     def draw(self, stdscr, x0, y0):
 
         if not self.has_draw_been_called:
+          # The format here is (index, foreground, background).
+          curses.init_pair(GROUP_HIGHLIGHT, 246, 234)
+          curses.init_pair(BACKGROUND, 7, 16)
+          curses.init_pair(CLUE, 241, 16)
           stdscr.bkgd(' ', curses.color_pair(BACKGROUND))
           self.has_draw_been_called = True
 
+        current_idx = self.get_group_idx(self.cursor)
         current_group = ['', tuple(self.cursor)]
-        for group in self.groups:
-            if tuple(self.cursor) in group:
-                current_group = group
+        if current_idx != -1:
+            current_group = self.groups[current_idx]
         current_group_top_y = self.get_top_y_value(current_group)
+        current_pts = set(current_group[1:])
 
         self.x0 = x0
         self.y0 = y0
@@ -395,7 +543,7 @@ class Puzzle(object):
                         if (y - y0) % self.y_stride != 1:
                             ch = '.'
                         attr = curses.color_pair(GROUP_HIGHLIGHT)
-                    if (x1, y1) in current_group:
+                    if (x1, y1) in current_pts:
                         attr = curses.color_pair(GROUP_HIGHLIGHT)
                         # if y1 == current_group_top_y:
                         if (y - y0) % self.y_stride == 1:
@@ -457,6 +605,7 @@ class Puzzle(object):
                 [group[0]] + [tuple(pt) for pt in group[1:]]
                 for group in info['groups']
         ]
+        self.version += 1
 
 
 # ______________________________________________________________________
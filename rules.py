@@ -0,0 +1,1055 @@
+""" rules.py
+
+    A rule-based solver that works the way a person might: it applies simple
+    deduction rules, one at a time, and describes each step in words.
+
+    This is a work in progress. The rules here don't solve every puzzle yet,
+    and the squares we can't deduce are left as '?'.
+
+    Everything we learn during a solve is kept in a SolveState, and each rule
+    is a function that accepts the state and returns True when it made
+    progress. The puzzle itself is never changed, so several solves can run at
+    once, in threads or in a process pool. The main function is solve(), which
+    returns the list of steps and the final grid.
+
+    Each rule looks at either lines (rows and columns) or groups, and only
+    revisits the ones that have changed since it last looked. When we learn
+    something about a square or a group, we add the lines and groups it
+    affects to the worklists of the rules that care about them; see the
+    touch_*() methods of SolveState. Summaries of each line, as given by
+    get_line_limited_info(), are cached until the line changes. This way the
+    work done in a solve grows with the number of deductions, rather than
+    with the number of squares times the number of passes.
+
+    Sets of values are stored as int bitmasks, where bit v is set when v is in
+    the set, as in propagate.py. Group options are multisets of values, and
+    are stored as count vectors: tuples c where c[v] is the number of times v
+    appears, for v = 0, 1, ..., puzzle.size.
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+import heapq
+from collections import defaultdict
+from functools import lru_cache, reduce
+from operator import add, mul, or_
+
+import dbg
+import partition
+import search
+import totals
+from alg_P import algorithm_L
+from puzzle import Op
+
+
+# ______________________________________________________________________
+# Globals
+
+# check_for_line_totals() only uses totals with at most this many unknown
+# squares, since those are the ones a person could work with.
+max_total_unknowns = 6
+
+# check_and_remove_bad_grp_options() only looks at groups with at most this
+# many squares.
+max_placement_sqrs = 6
+
+
+# ______________________________________________________________________
+# Classes
+
+class SolveState(object):
+    """ A SolveState holds what we know so far while solving one puzzle.
+
+        grp_options[grp_idx] = [(counts1, why1), (counts2, why2), ...]
+        Each counts value is a count vector for one possible multiset of
+        values for the group. If a value is empty, this means we haven't
+        evaluated it yet. Groups are indexed by their position in
+        puzzle.groups, and puzzle.get_group_idx() gives the group of a
+        square, or -1 for a square in no group (eg, while editing).
+
+        sqr_options[sqr_idx] = (mask_of_possible_values, why).
+        If a square is missing, this means we haven't evaluated it yet.
+        Squares are indexed by (x, y), 0-indexed, starting at the upper-left
+        corner. I decided to start at the upper-left corner for a couple
+        reasons:
+        * It's what's already used internally, based on how screen
+          coordinates typically work (for terminals).
+        * It's English reading-order, which I think many people will find more
+          intuitive as I plan to express it as, eg, square C3, similar to a
+          spreadsheet.
+        We can record that a square has a known value by giving it a mask with
+        a single bit in sqr_options.
+
+        soln_hist is a list of deductions of the form (str, why).
+
+        In each of the above, a `why` object has the form:
+            [RULE_NAME, hist_idx1, hist_idx2, ...]
+        where RULE_NAME is a string and the subsequent history indexes point
+        into soln_hist to tell us which previous deductions were used.
+
+        Our soln_hist has two parts to it: a prefix that we consider to be
+        "good enough so far," and a suffix which we may prune as we proceed.
+        The "good enough so far" prefix is exactly soln_hist[:good_soln].
+
+        full_soln is a list of puzzle.size^2 values that begin as all '?'
+        strings, and that we'll work to turn into numeric values with the
+        puzzle's solution.
+
+        budget is the search.Budget for this solve. We tick it once per
+        iteration of the main loop, and once per group we try to place in
+        check_and_remove_bad_grp_options().
+
+        worklists[rule] is the set of lines or groups that `rule` has yet to
+        look at. A line is written as (coord, val), meaning the squares with
+        pt[coord] == val, as in get_line_limited_info(). line_info and
+        grp_choices are caches that are cleared as lines and groups change.
+
+        full is the mask of all the values 1..puzzle.size.
+    """
+
+    def __init__(self, puzzle, budget=None):
+
+        N = puzzle.size
+
+        self.puzzle      = puzzle
+        self.budget      = budget if budget is not None else search.Budget()
+        self.grp_options = defaultdict(list)
+        self.sqr_options = {}
+        self.soln_hist   = []
+        self.good_soln   = 0
+        self.full_soln   = ['?'] * (N ** 2)
+        self.full        = ((1 << N) - 1) << 1  # Bits 1..N are set.
+
+        # clued_grps is the set of groups with a valid clue. Groups without
+        # one don't constrain their squares, so the rules skip them.
+        self.clued_grps = {
+                i for i, grp in enumerate(puzzle.groups)
+                if puzzle.get_clue(grp).op is not None
+        }
+        # lines_of_grp[grp_idx] is the list of lines the group touches, and
+        # grps_in_line[line] is the set of clued groups that touch the line.
+        self.lines_of_grp = []
+        self.grps_in_line = defaultdict(set)
+        for i, grp in enumerate(puzzle.groups):
+            lines = {(0, x) for x, y in grp[1:]} | {(1, y) for x, y in grp[1:]}
+            self.lines_of_grp.append(sorted(lines))
+            if i in self.clued_grps:
+                for line in lines:
+                    self.grps_in_line[line].add(i)
+
+        self.worklists   = defaultdict(set)
+        self.line_info   = {}  # line -> get_line_limited_info() result.
+        self.grp_choices = {}  # grp_idx -> the union of its options.
+
+    def set_square(self, pt, val, why, step):
+        """ Record that the square at `pt` has value `val`, as explained by
+            the string `step`.
+        """
+        self.sqr_options[pt] = (1 << val, why)
+        self.soln_hist.append(step)
+        self.full_soln[pt[0] + self.puzzle.size * pt[1]] = val
+        dbg.print(step)
+        self.touch_square(pt)
+
+    def narrow_square(self, pt, mask, why):
+        """ Limit the square at `pt` to the values in `mask`. If that leaves a
+            single value, we record it as a step.
+        """
+        if num_bits(mask) == 1:
+            val = elt(mask)
+            step = f'{pt_name(pt)}={val} as the only value left.'
+            self.set_square(pt, val, why, step)
+            return
+        self.sqr_options[pt] = (mask, why)
+        self.touch_square(pt)
+
+    def set_grp_options(self, i, options, step=None):
+        """ Replace the options of group i with the list `options`, as
+            explained by the string `step`, if given.
+        """
+        self.grp_options[i] = options
+        if step is not None:
+            self.soln_hist.append(step)
+            dbg.print(step)
+        self.touch_grp(i)
+
+    def touch_line(self, line):
+        """ Note that something about `line` has changed. """
+        self.line_info.pop(line, None)
+        self.worklists[check_for_line_elims].add(line)
+        self.worklists[check_for_one_place_left].add(line)
+        self.worklists[check_for_line_subsets].add(line)
+        self.worklists[check_for_line_totals].add(line)
+        # The in-line check of check_for_single_grp_option() looks at the rest
+        # of the line.
+        self.worklists[check_for_single_grp_option].update(
+                self.grps_in_line[line]
+        )
+        # Values caught in the line may rule out placements of its groups.
+        self.worklists[check_and_remove_bad_grp_options].update(
+                self.grps_in_line[line]
+        )
+
+    def touch_square(self, pt):
+        """ Note that we know more about the square at `pt`. """
+        self.touch_line((0, pt[0]))
+        self.touch_line((1, pt[1]))
+        i = self.puzzle.get_group_idx(pt)
+        if i in self.clued_grps:
+            self.worklists[check_for_grp_completion].add(i)
+
+    def touch_grp(self, i):
+        """ Note that the options of group i have changed. """
+        self.grp_choices.pop(i, None)
+        self.worklists[check_for_single_grp_option].add(i)
+        self.worklists[check_and_remove_bad_grp_options].add(i)
+        for line in self.lines_of_grp[i]:
+            self.touch_line(line)
+
+    def take_work(self, rule, key=None):
+        """ Yield the items on the worklist of `rule` in order of key(item),
+            removing each one from the worklist. Items added during the pass
+            are also yielded if they come after the current item, so a pass
+            sees the same changes a full scan in that order would see. Items
+            that come earlier are left for the next pass.
+        """
+
+        if key is None:
+            key = lambda item: item
+
+        worklist = self.worklists[rule]
+        heap, in_heap = [], set()
+        cur_key = None
+        while True:
+            for item in list(worklist):
+                item_key = key(item)
+                if cur_key is not None and item_key <= cur_key:
+                    continue
+                worklist.discard(item)
+                if item not in in_heap:
+                    in_heap.add(item)
+                    heapq.heappush(heap, (item_key, item))
+            if not heap:
+                return
+            cur_key, item = heapq.heappop(heap)
+            yield item
+
+
+# ______________________________________________________________________
+# Internal functions
+
+def num_bits(mask):
+    return bin(mask).count('1')
+
+def elt(mask):
+    """ Return the value in `mask`, which must hold a single value. """
+    assert num_bits(mask) == 1
+    return mask.bit_length() - 1
+
+def get_values(mask):
+    """ Return the sorted list of values in `mask`. """
+    values = []
+    while mask:
+        low_bit = mask & -mask
+        values.append(low_bit.bit_length() - 1)
+        mask ^= low_bit
+    return values
+
+def get_counts(nums, size):
+    """ Return the count vector of the list `nums` of values in 1..size. """
+    counts = [0] * (size + 1)
+    for num in nums:
+        counts[num] += 1
+    return tuple(counts)
+
+def get_nums(counts):
+    """ Return the sorted list of values in the count vector `counts`. """
+    return [num for num, count in enumerate(counts) for _ in range(count)]
+
+def get_mask(counts):
+    """ Return the mask of values in the count vector `counts`. """
+    mask = 0
+    for num, count in enumerate(counts):
+        if count:
+            mask |= 1 << num
+    return mask
+
+def is_multisubset(a, b):
+    """ Return True when count vector a is a subset of count vector b,
+        considering both as multisets.
+    """
+    return all(a_count <= b_count for a_count, b_count in zip(a, b))
+
+def multiset_sub(big, small):
+    """ Return `big` - `small`, seen as multisets. """
+    assert is_multisubset(small, big)
+    return tuple(big_count - small_count
+                 for big_count, small_count in zip(big, small))
+
+def get_line_name(coord, val):
+    """ Return a name such as 'row 3' or 'col c' for the line (coord, val). """
+    if coord == 0:
+        return f'col {chr(ord("a") + val)}'
+    return f'row {val + 1}'
+
+@lru_cache(maxsize=None)
+def get_subsets(n):
+    """ Return the list of masks of the subsets of range(n) with at least 2
+        and at most n - 2 elements, smallest first.
+    """
+    subsets = [
+            subset
+            for subset in range(1 << n)
+            if 2 <= num_bits(subset) <= n - 2
+    ]
+    return sorted(subsets, key=lambda subset: (num_bits(subset), subset))
+
+def get_unions(masks):
+    """ Return the list `unions` where unions[subset] is the union of
+        masks[j] for each bit j in subset.
+    """
+    unions = [0] * (1 << len(masks))
+    for subset in range(1, len(unions)):
+        low_bit = subset & -subset
+        j = low_bit.bit_length() - 1
+        unions[subset] = unions[subset ^ low_bit] | masks[j]
+    return unions
+
+def line_order(line):
+    """ This is the sort key for lines (coord, val): we visit lines in order of
+        val, and then coord.
+    """
+    return line[1], line[0]
+
+def pt_name(pt):
+    xname = chr(ord('a') + pt[0])
+    return f'{xname}{pt[1] + 1}'
+
+def pretty_print_grp_options(state):
+    puzzle = state.puzzle
+    for i, grp in enumerate(puzzle.groups):
+        clue_pt = puzzle.get_clue_point(grp)
+        dbg.print(f'{grp[0]:4s} @ {clue_pt}: ', end='')
+        dbg.print(*[get_nums(x[0]) for x in state.grp_options[i]])
+
+def get_grp_choices(state, i):
+    """ Return the mask of values that appear in any option of group i, or
+        state.full if we haven't found its options. The result is cached in
+        state.grp_choices until the group's options change.
+    """
+    if i not in state.grp_choices:
+        options = state.grp_options[i]
+        state.grp_choices[i] = reduce(or_, [
+            get_mask(option[0])
+            for option in options
+        ]) if options else state.full
+    return state.grp_choices[i]
+
+def get_sqr_cands(state, pt):
+    """ Return the mask of values the square at `pt` could hold, based on
+        sqr_options and the options of its group, if it's in one.
+    """
+    mask = state.sqr_options[pt][0] if pt in state.sqr_options else state.full
+    i = state.puzzle.get_group_idx(pt)
+    if i < 0:
+        return mask
+    return mask & get_grp_choices(state, i)
+
+def get_known_total(state, i, op):
+    """ Return the sum (when op == add) or product (when op == mul) of group
+        i if we know it, and None otherwise.
+    """
+    grp = state.puzzle.groups[i]
+    vals = [state.full_soln[x + state.puzzle.size * y] for x, y in grp[1:]]
+    if '?' not in vals:
+        return totals.combine(op, vals)
+    options = state.grp_options[i]
+    if not options:
+        return None
+    return totals.get_grp_total([get_nums(option[0]) for option in options], op)
+
+def get_line_limited_info(state, coord, val, excl_grp=None):
+    """ This looks at the line given by pt[coord] == val.
+        This returns knowns_by_sqr, free, solved, caught_in_line.
+        `knowns_by_sqr` is a list with the mask of possible values for each
+        square of the line, in order:
+        * For a square with an exactly-known value, this has a single bit.
+        * For a square in an all-in-line group with a single option, this is
+          the mask of values in that option.
+        * Otherwise, this is the intersection given by grp_options and
+          sqr_options; it's self.full when we know nothing.
+        `free` is a mask with bit k set when knowns_by_sqr[k] is in the last
+        of these cases.
+        `solved` is the mask of values of exactly-known squares.
+        `caught_in_line` is the mask of numbers such that we either know
+        exactly which square in this line has that value, or we know exactly
+        which group in this line has that value.
+
+        If a group (an element of puzzle.groups) is provided in excl_grp, then
+        we pretend that nothing is known about that given group.
+
+        Without excl_grp, the result is cached in state.line_info until the
+        line changes, so callers must not modify it.
+    """
+
+    line = (coord, val)
+    if excl_grp is None and line in state.line_info:
+        return state.line_info[line]
+
+    puzzle      = state.puzzle
+    grp_options = state.grp_options
+    sqr_options = state.sqr_options
+
+    # XXX
+    do_debug_print = False
+
+    if do_debug_print:
+        dbg.print(f'get_line_limited_info(puzzle, {coord}, {val})')
+
+    lst_pt = [0, 0]
+    lst_pt[coord] = val
+
+    knowns_by_sqr = []
+    free = solved = caught_in_line = 0
+
+    c2 = 1 - coord
+    for v2 in range(puzzle.size):
+
+        lst_pt[c2] = v2
+        pt = tuple(lst_pt)
+
+        # Are we skipping this square?
+        if excl_grp and pt in excl_grp:
+            continue
+
+        # Have we solved this square?
+
+        if pt in sqr_options and num_bits(sqr_options[pt][0]) == 1:
+            mask = sqr_options[pt][0]
+            knowns_by_sqr.append(mask)
+            solved |= mask
+            caught_in_line |= mask
+            continue
+
+        # Is this part of an all-in-line group?
+
+        sqr_choices = state.full
+
+        i = puzzle.get_group_idx(pt)
+        grp = puzzle.groups[i] if i >= 0 else None
+        if grp is None:
+            pass  # A square in no group could hold any value.
+        elif all(p[coord] == val for p in grp[1:]):
+            if len(grp_options[i]) == 1:
+                mask = get_grp_choices(state, i)
+                knowns_by_sqr.append(mask)
+                caught_in_line |= mask
+                continue
+            elif len(grp_options[i]) > 1:
+                sqr_choices = get_grp_choices(state, i)
+        else:
+
+            # We may be able to narrow down sqr_choices by starting with all the
+            # group options (even if it is not all in this line).
+
+            sqr_choices = get_grp_choices(state, i)
+
+        # Check to see how much info we gain from sqr_options.
+
+        if pt in sqr_options:
+            sqr_choices &= sqr_options[pt][0]
+
+        free |= 1 << len(knowns_by_sqr)
+        knowns_by_sqr.append(sqr_choices)
+
+    info = knowns_by_sqr, free, solved, caught_in_line
+
+    if do_debug_print:
+        dbg.print(f'  will return {info}')
+
+    if excl_grp is None:
+        state.line_info[line] = info
+
+    return info
+
+
+# ______________________________________________________________________
+# Rules
+#
+# Each rule accepts a SolveState, adds what it can deduce to the state, and
+# returns True when it made progress.
+
+def check_for_line_elims(state):
+
+    puzzle = state.puzzle
+
+    did_make_progress = False
+
+    for coord, val in state.take_work(check_for_line_elims, key=line_order):
+        knowns_by_sqr, free, solved, caught_in_line = get_line_limited_info(
+                state,
+                coord,
+                val
+        )
+        if num_bits(caught_in_line) != puzzle.size - 1:
+            continue
+
+        # At this point, we have found a new square value, unless the puzzle
+        # has no solution, which can happen while it's being edited.
+
+        if num_bits(free) != 1:
+            continue
+        i = free.bit_length() - 1
+
+        pt = (val, i) if coord == 0 else (i, val)
+        sqr_val = elt(state.full & ~caught_in_line)
+        why = ('line_elim', [])  # TODO: Account for history here.
+        line_name = 'col' if coord == 0 else 'row'
+        step = f'{pt_name(pt)}={sqr_val} by {line_name} elimination.'
+        state.set_square(pt, sqr_val, why, step)
+        did_make_progress = True
+
+    # XXX
+    # dbg.print(f'check_for_line_elims() will return {did_make_progress}')
+    return did_make_progress
+
+def check_and_remove_bad_grp_options(state):
+    """ Drop the options of each group that can't be placed in its squares.
+        A square can't hold a value that's caught elsewhere in its row or
+        column (see get_line_limited_info()) or that sqr_options rules out,
+        and a value can't repeat within a row or column of the group. We try
+        the distinct orders of each option's values until one fits.
+
+        The number of orders grows quickly with the size of a group, so we
+        only look at groups with at most max_placement_sqrs squares.
+    """
+
+    puzzle = state.puzzle
+
+    did_make_progress = False
+
+    for i in state.take_work(check_and_remove_bad_grp_options):
+
+        grp = puzzle.groups[i]
+        pts = grp[1:]
+        options = state.grp_options[i]
+        if len(options) < 2 or len(pts) > max_placement_sqrs:
+            continue
+        state.budget.tick()
+
+        # allowed[k] is the mask of values that pts[k] could hold, and
+        # conflicts[k] lists the earlier squares of the group in its lines.
+        allowed = []
+        for pt in pts:
+            mask = state.full
+            if pt in state.sqr_options:
+                mask = state.sqr_options[pt][0]
+            for coord in [0, 1]:
+                info = get_line_limited_info(state, coord, pt[coord], grp)
+                mask &= ~info[3]  # Drop the values caught_in_line.
+            allowed.append(mask)
+        conflicts = [
+                [
+                    j for j in range(k)
+                    if pts[j][0] == pt[0] or pts[j][1] == pt[1]
+                ]
+                for k, pt in enumerate(pts)
+        ]
+
+        def fits(nums):
+            return all(
+                    allowed[k] >> num & 1 and
+                    all(nums[j] != num for j in conflicts[k])
+                    for k, num in enumerate(nums)
+            )
+
+        # Algorithm L skips orders that differ only by swapping equal numbers,
+        # so each way of filling the group is tried once.
+        good = [
+                option for option in options
+                if any(fits(nums) for nums in algorithm_L(get_nums(option[0])))
+        ]
+
+        if not good:
+            # As in check_for_single_grp_option(), this means the puzzle has
+            # no solution, so we leave the options as they were.
+            dbg.print(f'WARNING: No options fit group {i}; the puzzle '
+                      'may have no solution.')
+            continue
+        if len(good) == len(options):
+            continue
+
+        bad = [str(get_nums(option[0])) for option in options
+               if option not in good]
+        clue_pt = puzzle.get_clue_point(grp)
+        step = (f'Group @ {pt_name(clue_pt)}({grp[0]}) can\'t be '
+                f'{" or ".join(bad)}, as they don\'t fit.')
+        state.set_grp_options(i, good, step)
+        did_make_progress = True
+
+    return did_make_progress
+
+def check_for_single_grp_option(state):
+
+    puzzle      = state.puzzle
+    grp_options = state.grp_options
+
+    did_make_progress = False
+
+    for i in state.take_work(check_for_single_grp_option):
+
+        grp = puzzle.groups[i]
+
+        if len(grp_options[i]) == 1:
+            # We already have full group info here; skip.
+            continue
+
+        clue = puzzle.get_clue(grp)
+
+        if clue.op is None:
+            dbg.print('WARNING: Soln request on a puzzle w an empty clue!!')
+            return False
+
+        if clue.op == Op.GIVEN:
+            # This happens for single-box groups with given values.
+            continue
+        group_w = len({pt[0] for pt in grp[1:]})
+        group_h = len({pt[1] for pt in grp[1:]})
+        options = grp_options[i]
+
+        # For groups in a single line, check for compatibility within the line.
+        if group_w == 1 or group_h == 1:
+
+            coord = 0 if group_w == 1 else 1
+            val = grp[1][coord]
+
+            knowns_by_sqr, free, solved, caught_in_line = get_line_limited_info(
+                    state,
+                    coord,
+                    val,
+                    excl_grp = grp  # So that caught_in_line excludes this grp.
+            )
+
+            # XXX rest of this block
+            start_num_parts = len(options)
+
+            options = [
+                    option
+                    for option in options
+                    if not (get_mask(option[0]) & caught_in_line)
+            ]
+
+            end_num_parts = len(options)
+
+            if end_num_parts == 0:
+                # This can't happen if the puzzle is solvable. We can't stop
+                # to debug here, as we may be in a worker process, so we note
+                # it and leave this group's options as they were.
+                dbg.print(f'WARNING: No options fit group {i}; the puzzle '
+                          'may have no solution.')
+                continue
+
+            if end_num_parts < start_num_parts:
+                dbg.print('*' * 70)
+                dbg.print(f'I have the reduced partition set (clue={clue}):')
+                dbg.print([get_nums(option[0]) for option in options])
+
+        # TODO Later: Try all layouts for each partition to see if it can
+        #             possibly be compatible with each line that it's in.
+
+        if not (len(options) == 1 and len(grp_options[i]) != 1):
+            continue
+
+        # XXX
+        k = len(grp_options[i])
+        dbg.print(f'I think I found smth new b/c len(grp_options[i]) = {k}')
+        dbg.print(f'Specifically, grp_options[i] = {grp_options[i]}')
+
+        counts = options[0][0]
+        why = ('single_grp_opt', [])
+        clue_pt = puzzle.get_clue_point(grp)
+        step = f'Group @ {pt_name(clue_pt)}({grp[0]}) is {get_nums(counts)}'
+        state.set_grp_options(i, [(counts, why)], step)
+        did_make_progress = True
+
+    # dbg.print(f'check_for_single_grp_option() will return {did_make_progress}')
+    return did_make_progress
+
+def check_for_grp_completion(state):
+    """ Look for groups where we've filled in all the squares except for one.
+        In some cases, we can uniquely determine the last square, but (for the -
+        or / operators), not always.
+    """
+
+    puzzle      = state.puzzle
+    sqr_options = state.sqr_options
+
+    did_make_progress = False
+
+    for i in state.take_work(check_for_grp_completion):
+
+        grp = puzzle.groups[i]
+        grp_size = len(grp) - 1  # -1 for the clue
+
+        # TODO: Needed?
+        if grp_size < 1:
+            continue
+
+        # Check to see if we know all squares but one in this group.
+        known_in_grp = [0] * (puzzle.size + 1)  # A count vector.
+        num_known = 0
+        unknown_pt = None
+        for pt in grp[1:]:
+            if pt in sqr_options and num_bits(sqr_options[pt][0]) == 1:
+                known_in_grp[elt(sqr_options[pt][0])] += 1
+                num_known += 1
+            else:
+                unknown_pt = pt
+
+        if num_known != grp_size - 1:
+            continue
+
+        # The square might yet be unknown. Eg, the clue is 1- and the val is 3.
+        # Get the possible group options and use those.
+
+        if puzzle.get_clue(grp).op == Op.GIVEN:
+            continue
+
+        compatible_parts = [
+                option[0]
+                for option in state.grp_options[i]
+                if is_multisubset(known_in_grp, option[0])
+        ]
+
+        assert len(compatible_parts) > 0
+        if len(compatible_parts) != 1:
+            continue  # This is the case where we don't know the sqr yet.
+
+        delta = multiset_sub(compatible_parts[0], known_in_grp)
+        sqr_val = elt(get_mask(delta))
+        why = ('grp_completion', [])  # TODO: Account for history.
+        step = f'{pt_name(unknown_pt)}={sqr_val} by group completion.'
+        state.set_square(unknown_pt, sqr_val, why, step)
+        did_make_progress = True
+
+    return did_make_progress
+
+def check_for_one_place_left(state):
+
+    puzzle = state.puzzle
+
+    did_make_progress = False
+
+    for coord, val in state.take_work(check_for_one_place_left, key=line_order):
+        knowns_by_sqr, free, solved, caught_in_line = get_line_limited_info(
+                state,
+                coord,
+                val
+        )
+
+        # For each num, check to see how many spaces it could live in. A num
+        # is in `once` if it could live in at least one square, and in `twice`
+        # if it could live in at least two.
+        once = twice = 0
+        for mask in knowns_by_sqr:
+            twice |= once & mask
+            once  |= mask
+
+        for num in get_values(once & ~twice & ~solved):
+            bit = 1 << num
+            home_val = next(
+                    i for i, mask in enumerate(knowns_by_sqr) if mask & bit
+            )
+            pt = (val, home_val) if coord == 0 else (home_val, val)
+            why = ('one_place_left', [])  # TODO: Account for history.
+            line_name = 'col' if coord == 0 else 'row'
+            step = f'''
+                {pt_name(pt)}={num} by only-place-left in {line_name}.
+            '''.strip()
+            state.set_square(pt, num, why, step)
+            did_make_progress = True
+
+    return did_make_progress
+
+def check_for_line_subsets(state):
+    """ Look for Hall sets in each line: sets of k unknown squares whose
+        possible values, taken together, are just k values. Those values must
+        fill those squares, so the line's other unknown squares can't hold
+        them. Seen from the other side, the remaining values can only go into
+        the remaining squares, so those squares can't hold anything else.
+
+        For k = 2, 3, or 4 on the smaller side, these are known as naked pairs,
+        triples, and quads when the smaller side is the squares we found, and
+        hidden pairs, triples, and quads when it's the other squares.
+    """
+
+    did_make_progress = False
+
+    for coord, val in state.take_work(check_for_line_subsets, key=line_order):
+        knowns_by_sqr, free, solved, caught_in_line = get_line_limited_info(
+                state,
+                coord,
+                val
+        )
+
+        # The free squares must hold exactly the values that aren't caught.
+        missing = state.full & ~caught_in_line
+        sqr_idx = [i for i in range(len(knowns_by_sqr)) if free >> i & 1]
+        cands = [knowns_by_sqr[i] & missing for i in sqr_idx]
+        n = len(cands)
+
+        unions = get_unions(cands)
+        for subset in get_subsets(n):
+
+            values = unions[subset]
+            if num_bits(values) != num_bits(subset):
+                continue
+
+            # These are the squares outside the subset that lose values.
+            others = [
+                    j for j in range(n)
+                    if not subset >> j & 1 and cands[j] & values
+            ]
+            if not others:
+                continue
+
+            # Describe the deduction from its smaller side.
+            k = num_bits(subset)
+            if k <= n - k:
+                sqrs, nums, kind = subset, values, 'naked'
+            else:
+                sqrs, nums, kind = ~subset, missing & ~values, 'hidden'
+                k = n - k
+            if k <= 4:
+                name = kind + ' ' + ['pair', 'triple', 'quad'][k - 2]
+            else:
+                name = 'Hall set'
+
+            pts = [
+                    (val, sqr_idx[j]) if coord == 0 else (sqr_idx[j], val)
+                    for j in range(n)
+            ]
+            sqr_names = ' '.join(
+                    pt_name(pts[j]) for j in range(n) if sqrs >> j & 1
+            )
+            num_names = ', '.join(str(num) for num in get_values(nums))
+            line_name = get_line_name(coord, val)
+            step = f'{sqr_names} hold {num_names} as a {name} in {line_name}.'
+            state.soln_hist.append(step)
+            dbg.print(step)
+
+            why = (name.replace(' ', '_'), [len(state.soln_hist) - 1])
+            for j in others:
+                cands[j] &= ~values
+                state.narrow_square(pts[j], cands[j], why)
+            unions = get_unions(cands)
+            did_make_progress = True
+
+    return did_make_progress
+
+def check_for_line_totals(state):
+    """ Use the sums and products of whole lines to learn about the squares
+        inside, or sticking out of, a region of adjacent rows or columns; see
+        totals.py.
+
+        Any square can be part of a line total, so we look at every region
+        whenever any line has changed.
+    """
+
+    puzzle = state.puzzle
+    N = puzzle.size
+
+    if not list(state.take_work(check_for_line_totals)):
+        return False
+
+    did_make_progress = False
+
+    for op, verb in [(add, 'sum to'), (mul, 'multiply to')]:
+
+        grp_totals = [
+                get_known_total(state, i, op)
+                for i in range(len(puzzle.groups))
+        ]
+        line_totals = totals.get_line_totals(puzzle, grp_totals, op)
+
+        for name, kind, total, pts in line_totals:
+
+            # Take out the squares we already know.
+            unknown = []
+            for pt in pts:
+                val = state.full_soln[pt[0] + N * pt[1]]
+                if val == '?':
+                    unknown.append(pt)
+                elif total is not None:
+                    total = totals.uncombine(op, total, val)
+            if total is None or not 0 < len(unknown) <= max_total_unknowns:
+                continue
+
+            cands = [get_sqr_cands(state, pt) for pt in unknown]
+            new_cands = totals.narrow_to_total(cands, op, total)
+            if new_cands == cands or not all(new_cands):
+                continue
+
+            why = ('line_total', [])
+            if len(unknown) == 1:
+                pt, val = unknown[0], elt(new_cands[0])
+                step = f'{pt_name(pt)}={val} as the {kind} of {name}.'
+                state.set_square(pt, val, why, step)
+            else:
+                sqr_names = ' '.join(pt_name(pt) for pt in unknown)
+                step = f'{sqr_names} {verb} {total} as the {kind} of {name}.'
+                state.soln_hist.append(step)
+                dbg.print(step)
+                why = ('line_total', [len(state.soln_hist) - 1])
+                for pt, mask, new_mask in zip(unknown, cands, new_cands):
+                    if new_mask != mask:
+                        state.narrow_square(pt, new_mask, why)
+            did_make_progress = True
+
+    return did_make_progress
+
+def apply_rule(rule, state):
+    """ Return rule(state), recording the call in state.budget.stats. Each
+        rule gets its own entry in stats.phase_times.
+    """
+    budget = state.budget
+    budget.stats.num_props += 1
+    with budget.phase(rule.__name__):
+        return rule(state)
+
+
+# ______________________________________________________________________
+# Public functions
+
+def solve(puzzle, budget=None):
+    """ Apply human-style deduction rules to `puzzle` until we get stuck.
+
+        This returns (steps, grid), where `steps` is the list of deductions
+        made, in order, as strings, and `grid` is the (possibly partial)
+        solution in reading order, with '?' for each unknown square. If the
+        optional search.Budget runs out, the deductions stop early and
+        budget.stop_reason says why.
+
+        The puzzle is not changed.
+    """
+
+    state = SolveState(puzzle, budget)
+    state.budget.start()
+
+    # 1. Find given squares.
+
+    for x in range(puzzle.size):
+        for y in range(puzzle.size):
+            pt = (x, y)
+            i = puzzle.get_group_idx(pt)
+            if i < 0:
+                continue
+            grp = puzzle.groups[i]
+            clue = puzzle.get_clue(grp)
+            if clue.op == Op.GIVEN:
+                val = clue.num
+                why = ('given', [])
+                state.set_square(pt, val, why, f'Given: {pt_name(pt)}={val}')
+                state.good_soln += 1
+
+    # 2. Set up initial grp_options.
+
+    for i, grp in enumerate(puzzle.groups):
+
+        clue = puzzle.get_clue(grp)
+
+        # Groups without a valid clue (eg, while editing) get no options.
+        if clue.op is None or clue.op == Op.GIVEN:
+            continue
+        parts = partition.get_group_partitions(puzzle, grp)
+
+        state.set_grp_options(i, [
+                (get_counts(part, puzzle.size), 'listing all group options')
+                for part in parts
+        ])
+
+    # 3. Put every line and group on the worklists.
+
+    for i in sorted(state.clued_grps):
+        state.touch_grp(i)
+        state.worklists[check_for_grp_completion].add(i)
+
+    dbg.print('sqr_options:')
+    dbg.print(state.sqr_options)
+    dbg.print('grp_options:')
+    pretty_print_grp_options(state)
+
+    # XXX
+    i = 1
+
+    try:
+        did_make_progress = True
+        while did_make_progress:
+
+            state.budget.tick()
+            dbg.print(f'\nStart of iteration {i}.\n')
+
+            did_make_progress = False
+            did_make_progress |= apply_rule(check_for_line_elims, state)
+            # TODO: Drop check_for_single_grp_option().
+            #       I believe it's made obsolete by step 2 above.
+            did_make_progress |= apply_rule(check_for_single_grp_option, state)
+            did_make_progress |= apply_rule(check_for_grp_completion, state)
+            did_make_progress |= apply_rule(
+                    check_and_remove_bad_grp_options,
+                    state
+            )
+
+            # I consider check-for-one-place-left to be a slightly trickier
+            # rule, so we only apply it when we get stuck with the simpler
+            # rules.
+            if not did_make_progress:
+                did_make_progress |= apply_rule(
+                        check_for_one_place_left,
+                        state
+                )
+
+            # Subsets within a line are trickier still.
+            if not did_make_progress:
+                did_make_progress |= apply_rule(check_for_line_subsets, state)
+
+            # As are line totals, which look at several lines at once.
+            if not did_make_progress:
+                did_make_progress |= apply_rule(check_for_line_totals, state)
+
+            # TODO:      It would be nice to start formally deciding the
+            #            difficulty rating of the various rules being used.
+            #            The idea here is to help understand the difficulty
+            #            of a puzzle by understanding the most-difficult rule
+            #            that had to be used. In some cases, I may feel as if
+            #            different applications of the same Python method may
+            #            qualify as different difficulty settings.
+
+            dmp = did_make_progress
+            dbg.print(f'Ending iteration {i}; did_make_progress = {dmp}.')
+
+            i += 1
+    except search.SearchStopped as e:
+        dbg.print(f'Stopping the rules-based solver; reason: {e.reason}')
+    finally:
+        state.budget.finish()
+
+    dbg.print('\n' + '_' * 30)
+
+    dbg.print('\nFinal row-based knowledge is:')
+    for val in range(puzzle.size):
+        knowns_by_sqr, free, solved, caught_in_line = get_line_limited_info(
+                state,
+                1,  # coord
+                val
+        )
+        knowns = [get_values(mask) for mask in knowns_by_sqr]
+        caught = get_values(caught_in_line)
+        dbg.print(f'{f"Row {val}: {knowns}":60s} Caught values: {caught}')
+
+    dbg.print('\nFinal grp_options are as follows:')
+    pretty_print_grp_options(state)
+
+    return state.soln_hist, state.full_soln
@@ -0,0 +1,285 @@
+""" search.py
+
+    Tools shared by the solvers to limit and measure a search.
+
+    A Budget says how long a search may run. It can hold any of these limits:
+
+        * a wall-clock deadline (or, equivalently, a time limit in seconds),
+        * a maximum number of search nodes,
+        * a cancellation token, which is any object with an is_set() method,
+          such as a threading.Event or a multiprocessing.Event.
+
+    Solvers call budget.tick() once per search node; when a limit is hit, this
+    raises SearchStopped, which the solver's entry point catches. Either way,
+    budget.stats holds statistics about the search. A budget can also be
+    given a `progress` function, which is called with budget.stats about every
+    `progress_interval` seconds while the search runs.
+
+    Besides node and solution counts, engines record backtracks, the maximum
+    depth reached, prunes broken down by reason, propagation counts, and time
+    spent in named phases; see SearchStats. For a closer look at a slow
+    search, a budget can be given a `trace` function, which engines call once
+    per search node as
+
+        trace(depth, choice, pruned_by)
+
+    where `choice` is the list of ((x, y), value) pairs set at that node, and
+    `pruned_by` is the prune reason, or None if the node was not pruned.
+
+    Sample usage:
+
+        budget = search.Budget(time_limit=2.0)
+        solns = solver.solve_puzzle(puzzle, budget=budget)
+        if not solns.is_complete:
+            print('Stopped early because of', solns.stop_reason)
+        print(solns.stats.num_nodes, 'nodes visited')
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+# ______________________________________________________________________
+# Globals
+
+# We check the clock and the cancellation token once per this many nodes.
+check_interval = 64
+
+
+# ______________________________________________________________________
+# Classes
+
+class SearchStopped(Exception):
+    """ This is raised by Budget.tick() when a limit is reached. The `reason`
+        is one of 'time', 'nodes', or 'cancel'.
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+class SearchStats(object):
+    """ Statistics about a single search.
+
+        `prunes` maps a reason to the number of nodes pruned for that reason.
+        The reasons are 'row' and 'col' for repeated values, 'given' for a
+        given square, and 'add', 'sub', 'mul', or 'div' for a group clue.
+        The dlx engine also uses 'square' for a square that can't be filled,
+        and the propagate engine uses 'total' for a line total; see totals.py.
+
+        `num_props` counts propagation steps, such as group revisions in the
+        propagate engine or rule applications in the rule-based solver.
+
+        `phase_times` maps a phase name, such as 'setup', to the seconds spent
+        in that phase. Time in the search itself is not a separate phase; it's
+        whatever part of `elapsed` the phases don't cover.
+    """
+
+    def __init__(self):
+        self.num_nodes      = 0
+        self.num_solns      = 0
+        self.num_backtracks = 0
+        self.max_depth      = 0
+        self.num_props      = 0
+        self.prunes         = defaultdict(int)
+        self.phase_times    = defaultdict(float)
+        self.start_time     = None
+        self.end_time       = None
+
+    @property
+    def elapsed(self):
+        """ The number of seconds the search has been (or was) running. """
+        if self.start_time is None:
+            return 0.0
+        end_time = self.end_time if self.end_time else time.time()
+        return end_time - self.start_time
+
+    @property
+    def nodes_per_sec(self):
+        elapsed = self.elapsed
+        return self.num_nodes / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+                'num_nodes'     : self.num_nodes,
+                'num_solns'     : self.num_solns,
+                'num_backtracks': self.num_backtracks,
+                'max_depth'     : self.max_depth,
+                'num_props'     : self.num_props,
+                'prunes'        : dict(self.prunes),
+                'phase_times'   : dict(self.phase_times),
+                'elapsed'       : self.elapsed,
+                'nodes_per_sec' : self.nodes_per_sec
+        }
+
+    def add_counts(self, stats_dict):
+        """ Add the counts from `stats_dict`, as given by as_dict(), to ours.
+            This is useful to combine the stats of several searches.
+        """
+        self.num_nodes      += stats_dict['num_nodes']
+        self.num_backtracks += stats_dict['num_backtracks']
+        self.max_depth       = max(self.max_depth, stats_dict['max_depth'])
+        self.num_props      += stats_dict['num_props']
+        for reason, num in stats_dict['prunes'].items():
+            self.prunes[reason] += num
+        for phase, secs in stats_dict['phase_times'].items():
+            self.phase_times[phase] += secs
+
+class Budget(object):
+    """ A set of limits for a search, along with that search's statistics.
+
+        `time_limit` is in seconds, counted from the start of the search;
+        `deadline` is an absolute time as given by time.time(). If both are
+        given, the earlier one applies.
+    """
+
+    def __init__(
+            self,
+            time_limit=None,
+            deadline=None,
+            max_nodes=None,
+            cancel=None,
+            progress=None,
+            progress_interval=0.5,
+            trace=None):
+        self.time_limit  = time_limit
+        self.deadline    = deadline
+        self.max_nodes   = max_nodes
+        self.cancel      = cancel
+        self.progress    = progress
+        self.progress_interval = progress_interval
+        self.trace       = trace
+        self.stop_reason = None
+        self.stats       = SearchStats()
+        self.next_check  = 0
+        self.next_progress_time = 0
+
+    def start(self):
+        """ Note the start time and set up the deadline. Calling this more
+            than once is harmless, so that one budget can cover several
+            searches. Each call clears stop_reason, which describes the
+            current search; a budget that's already used up will set it
+            again at the next check.
+        """
+        self.stop_reason = None
+        if self.stats.start_time is not None:
+            return
+        self.stats.start_time = time.time()
+        if self.time_limit is not None:
+            deadline = self.stats.start_time + self.time_limit
+            if self.deadline is None or deadline < self.deadline:
+                self.deadline = deadline
+
+    def finish(self):
+        self.stats.end_time = time.time()
+
+    def tick(self):
+        """ Count a search node, and raise SearchStopped if we're out of
+            budget.
+        """
+        stats = self.stats
+        stats.num_nodes += 1
+        if stats.num_nodes >= self.next_check:
+            self.check()
+
+    def check(self):
+        """ Raise SearchStopped if any limit has been reached. """
+
+        num_nodes = self.stats.num_nodes
+
+        if self.max_nodes is not None and num_nodes >= self.max_nodes:
+            self.stop('nodes')
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.stop('time')
+        if self.cancel is not None and self.cancel.is_set():
+            self.stop('cancel')
+
+        if self.progress is not None:
+            now = time.time()
+            if now >= self.next_progress_time:
+                self.next_progress_time = now + self.progress_interval
+                self.progress(self.stats)
+
+        self.next_check = num_nodes + check_interval
+        if self.max_nodes is not None:
+            self.next_check = min(self.next_check, self.max_nodes)
+
+    @contextmanager
+    def phase(self, name):
+        """ Add the time spent in a `with budget.phase(name):` block to
+            stats.phase_times[name].
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stats.phase_times[name] += time.perf_counter() - start
+
+    def stop(self, reason):
+        self.stop_reason = reason
+        raise SearchStopped(reason)
+
+class SolveResult(list):
+    """ A list of solutions, along with information about the search that
+        found them. If `is_complete` is False, the search was stopped early
+        for the reason in `stop_reason`, and there may be more solutions.
+    """
+
+    def __init__(self, solns=(), budget=None, engine=None):
+        super().__init__(solns)
+        budget = budget or Budget()
+        self.engine      = engine
+        self.stop_reason = budget.stop_reason
+        self.is_complete = budget.stop_reason is None
+        self.stats       = budget.stats
+
+class CountResult(object):
+    """ The number of solutions to a puzzle, as given by
+        solver.estimate_num_solutions().
+
+        If `is_exact` is True, `num_solns` is the exact number of solutions.
+        Otherwise it's an estimate, and the true number is likely between
+        `lo` and `hi`; `hi` is None when we have no upper bound. In that case,
+        `num_probes` is the number of random probes behind the estimate, and
+        `num_nodes` estimates the size of the backtrack engine's full search
+        tree, which says how long a complete count would take.
+
+        As in SolveResult, `stop_reason` says why the budget ran out, if it
+        did, and `stats` holds the search statistics.
+    """
+
+    def __init__(
+            self,
+            num_solns,
+            budget=None,
+            is_exact=False,
+            lo=None,
+            hi=None,
+            num_probes=0,
+            num_nodes=None):
+        budget = budget or Budget()
+        self.num_solns   = num_solns
+        self.is_exact    = is_exact
+        self.lo          = num_solns if is_exact else lo
+        self.hi          = num_solns if is_exact else hi
+        self.num_probes  = num_probes
+        self.num_nodes   = num_nodes
+        self.stop_reason = budget.stop_reason
+        self.stats       = budget.stats
+
+    def as_dict(self):
+        return {
+                'num_solns'  : self.num_solns,
+                'is_exact'   : self.is_exact,
+                'lo'         : self.lo,
+                'hi'         : self.hi,
+                'num_probes' : self.num_probes,
+                'num_nodes'  : self.num_nodes,
+                'stop_reason': self.stop_reason,
+                'stats'      : self.stats.as_dict()
+        }
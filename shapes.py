@@ -0,0 +1,257 @@
+""" shapes.py
+
+    An index of group shapes and the ways values can repeat within them.
+
+    Two squares of a group can only hold the same value if they share no row
+    or column. So any way to fill in a group splits its squares into classes
+    of equal values, where no two squares in a class share a line. We call
+    such a split a template, and write it as a tuple giving the class of each
+    square. The repeat pattern of a template is the tuple of its class sizes,
+    largest first.
+
+    A partition -- a multiset of values, such as [2, 2, 3] -- fits a group
+    exactly when the counts of its values, largest first, are the repeat
+    pattern of some template of the group's shape. The placements of the
+    partition are then found by giving each class of each such template a
+    different value with a matching count.
+
+    Shapes are normalized up to translation, so every group with the same
+    shape shares one entry in the index. Each entry is built the first time we
+    see its shape. A template can't have more classes than the puzzle has
+    values, so the index also depends on the puzzle size.
+
+    Large groups can have a huge number of templates; eg, a 4x4 group in a 9x9
+    puzzle has millions. So we give up on any shape whose templates take more
+    than max_template_steps steps to list. For those shapes, can_hold() is
+    always True, count_placements() gives an upper bound, and get_placements()
+    uses a plain backtracking search. The functions that may take a while
+    accept an optional `check` function, such as search.Budget.check, which
+    they call every so often so that callers can stop them.
+
+    This is more precise than limiting repeats to min(width, height) of a
+    group. For example, a plus-shaped group of five squares is 3 wide and 3
+    high, but its center shares a line with every other square, and each arm
+    shares a line with the opposite arm, so no value fits in it 3 times.
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+from collections import Counter, defaultdict
+from itertools import permutations, product
+from math import factorial
+
+
+# ______________________________________________________________________
+# Globals
+
+# We stop listing the templates of a shape after this many steps.
+max_template_steps = 20000
+
+# The `check` functions are called once per this many steps.
+check_interval = 1024
+
+# This maps (shape, max_classes) to the result of get_templates().
+templates_cache = {}
+
+
+# ______________________________________________________________________
+# Internal functions
+
+def normalize(pts):
+    """ Return (shape, order) for the group with points `pts`. The shape is
+        the sorted tuple of points translated so that the least x and least y
+        are 0. The point pts[k] becomes shape[order[k]].
+    """
+
+    x0 = min(x for x, y in pts)
+    y0 = min(y for x, y in pts)
+    moved = [(x - x0, y - y0) for x, y in pts]
+    shape = tuple(sorted(moved))
+    index = {pt: i for i, pt in enumerate(shape)}
+    return shape, [index[pt] for pt in moved]
+
+def get_conflicts(pts):
+    """ Return a list whose ith entry lists the indexes j < i for which pts[j]
+        shares a line with pts[i].
+    """
+    return [
+            [
+                j for j in range(i)
+                if pts[i][0] == pts[j][0] or pts[i][1] == pts[j][1]
+            ]
+            for i in range(len(pts))
+    ]
+
+def get_templates(shape, max_classes, check=None):
+    """ Return a dict that maps each repeat pattern of `shape` to the list of
+        templates with that pattern and at most `max_classes` classes, or
+        None if listing them takes more than max_template_steps steps.
+        Classes are numbered in order of first appearance, so each split of
+        the squares is listed once.
+    """
+
+    key = (shape, max_classes)
+    if key in templates_cache:
+        return templates_cache[key]
+
+    n = len(shape)
+    conflicts = get_conflicts(shape)
+
+    templates = defaultdict(list)
+    classes = [0] * n
+    num_steps = 0
+
+    # This returns False if we run out of steps.
+    def fill(i, num_classes):
+        nonlocal num_steps
+        num_steps += 1
+        if num_steps > max_template_steps:
+            return False
+        if check and num_steps % check_interval == 0:
+            check()
+        if i == n:
+            sizes = Counter(classes).values()
+            pattern = tuple(sorted(sizes, reverse=True))
+            templates[pattern].append(tuple(classes))
+            return True
+        for c in range(min(num_classes + 1, max_classes)):
+            if any(classes[j] == c for j in conflicts[i]):
+                continue
+            classes[i] = c
+            if not fill(i + 1, max(num_classes, c + 1)):
+                return False
+        return True
+
+    result = dict(templates) if fill(0, 0) else None
+    templates_cache[key] = result
+    return result
+
+def get_pattern(part):
+    """ Return the repeat pattern of the multiset `part`. """
+    return tuple(sorted(Counter(part).values(), reverse=True))
+
+def get_num_orders(counts):
+    """ Return the number of ways to give the classes of a template the values
+        with the given Counter `counts`; classes of the same size can take the
+        values with that count in any order.
+    """
+    num_orders = 1
+    for num_values in Counter(counts.values()).values():
+        num_orders *= factorial(num_values)
+    return num_orders
+
+def search_placements(pts, part, check=None):
+    """ Return the list that get_placements() returns, found by a plain
+        backtracking search rather than from the templates.
+    """
+
+    n = len(pts)
+    conflicts = get_conflicts(pts)
+    counts = Counter(part)
+    values = sorted(counts)
+
+    placements = []
+    x = [0] * n
+    num_steps = 0
+
+    def fill(i):
+        nonlocal num_steps
+        num_steps += 1
+        if check and num_steps % check_interval == 0:
+            check()
+        if i == n:
+            placements.append(tuple(x))
+            return
+        for val in values:
+            if counts[val] == 0 or any(x[j] == val for j in conflicts[i]):
+                continue
+            counts[val] -= 1
+            x[i] = val
+            fill(i + 1)
+            counts[val] += 1
+
+    fill(0)
+    return placements
+
+
+# ______________________________________________________________________
+# Public functions
+
+def get_repeat_patterns(pts, size, check=None):
+    """ Return the set of repeat patterns for the group with points `pts` in
+        a puzzle of the given size, or None if the shape is too big to index.
+    """
+    shape, order = normalize(pts)
+    templates = get_templates(shape, size, check)
+    return None if templates is None else set(templates)
+
+def can_hold(pts, part, size, check=None):
+    """ Return True if the values in `part` can be placed in the group with
+        points `pts` so that no value repeats within a row or column. For a
+        shape that's too big to index, this is always True.
+    """
+    shape, order = normalize(pts)
+    templates = get_templates(shape, size, check)
+    return templates is None or get_pattern(part) in templates
+
+def count_placements(pts, part, size, check=None):
+    """ Return len(get_placements(pts, part)) without listing the placements.
+        For a shape that's too big to index, this returns the number of
+        distinct orders of `part` instead, which is an upper bound.
+    """
+
+    shape, order = normalize(pts)
+    counts = Counter(part)
+    templates = get_templates(shape, size, check)
+
+    if templates is None:
+        num = factorial(len(part))
+        for count in counts.values():
+            num //= factorial(count)
+        return num
+
+    pattern = get_pattern(part)
+    return get_num_orders(counts) * len(templates.get(pattern, []))
+
+def get_placements(pts, part, size, check=None):
+    """ Return a list of tuples, each tuple holding values for `pts`, in that
+        order. These are all the ways to place exactly the values in `part`
+        into the group so that no value repeats within a row or column. Each
+        placement is listed once, even when `part` has repeated values.
+    """
+
+    shape, order = normalize(pts)
+    templates = get_templates(shape, size, check)
+    if templates is None:
+        return search_placements(pts, part, check)
+
+    counts = Counter(part)
+    pattern = get_pattern(part)
+
+    # values_of_size[s] lists the values that appear s times in `part`.
+    values_of_size = defaultdict(list)
+    for val, count in counts.items():
+        values_of_size[count].append(val)
+    sizes = sorted(values_of_size)
+
+    placements = []
+    for template in templates.get(pattern, []):
+
+        # classes_of_size[s] lists the classes of size s in this template.
+        classes_of_size = defaultdict(list)
+        for c, num in sorted(Counter(template).items()):
+            classes_of_size[num].append(c)
+
+        # Classes of each size can take the values of that count in any order.
+        for choice in product(*[
+                permutations(values_of_size[num]) for num in sizes]):
+            value_of_class = {}
+            for num, vals in zip(sizes, choice):
+                value_of_class.update(zip(classes_of_size[num], vals))
+            placements.append(tuple(
+                    value_of_class[template[i]] for i in order
+            ))
+
+    return placements
@@ -0,0 +1,169 @@
+""" totals.py
+
+    Constraints that come from the totals of whole lines.
+
+    Each row and column holds the values 1..N once each, so it sums to
+    N(N + 1)/2 and multiplies to N!. Take a region of k adjacent rows, or of k
+    adjacent columns. If we know the sum of each group that lies fully inside
+    the region, then the other squares of the region -- the "innies" -- must
+    sum to the rest of the region's total. In the same way, if we know the sum
+    of each group that touches the region, then the squares of those groups
+    that stick out of the region -- the "outies" -- must sum to the groups'
+    total minus the region's total. Both ideas work for products as well.
+
+    Often this gives us a few squares with a known sum or product, which can
+    fix or narrow their values. This is used both by the rule-based solver in
+    rules.py and by the propagate engine.
+
+    As in propagate.py, a set of candidate values is an int bitmask where bit v
+    is set when v is possible. Sums and products are chosen by passing in
+    operator.add or operator.mul as `op`.
+"""
+
+
+# ______________________________________________________________________
+# Imports
+
+from functools import lru_cache, reduce
+from math import factorial
+from operator import add, mul
+
+
+# ______________________________________________________________________
+# Internal functions
+
+@lru_cache(maxsize=None)
+def get_regions(size):
+    """ Return a tuple of (name, pts) pairs, one for each region of 1 to
+        size - 1 adjacent rows or columns.
+    """
+    regions = []
+    for k in range(1, size):
+        for start in range(size - k + 1):
+            lines = range(start, start + k)
+            rows = f'{start + 1}' if k == 1 else f'{start + 1}-{start + k}'
+            cols = chr(ord('a') + start)
+            if k > 1:
+                cols += '-' + chr(ord('a') + start + k - 1)
+            regions.append((
+                    f'row{"s" * (k > 1)} {rows}',
+                    tuple((x, y) for y in lines for x in range(size))
+            ))
+            regions.append((
+                    f'col{"s" * (k > 1)} {cols}',
+                    tuple((x, y) for x in lines for y in range(size))
+            ))
+    return tuple(regions)
+
+def combine(op, values):
+    return reduce(op, values, 0 if op == add else 1)
+
+def uncombine(op, total, part):
+    """ Return the x with op(x, part) == total, or None if there is none. """
+    if op == add:
+        return total - part
+    if part == 0 or total % part:
+        return None
+    return total // part
+
+
+# ______________________________________________________________________
+# Public functions
+
+def get_grp_total(parts, op):
+    """ Return the sum (or product) shared by every partition in `parts`, or
+        None if they don't all share one.
+    """
+    totals = {combine(op, part) for part in parts}
+    return totals.pop() if len(totals) == 1 else None
+
+def get_line_totals(puzzle, grp_totals, op, max_sqrs=None):
+    """ Return a list of (name, kind, total, pts) tuples. Each one says that
+        the values in the squares `pts` must sum to `total` when op == add, or
+        multiply to `total` when op == mul. The `kind` is 'innies' or
+        'outies', and `name` names the region they come from, as in
+        'rows 1-2'.
+
+        grp_totals[i] is the known sum or product of puzzle.groups[i], or
+        None if it's unknown. Squares in no group (eg, while editing) are
+        treated as unknown, so they only ever appear as innies. If `max_sqrs`
+        is given, we skip any list of pts that's longer. No two tuples have
+        the same set of pts.
+    """
+
+    N = puzzle.size
+    groups = puzzle.groups
+    line_total = N * (N + 1) // 2 if op == add else factorial(N)
+
+    totals = []
+    seen = set()
+
+    def add_total(name, kind, total, pts):
+        key = frozenset(pts)
+        if total is None or not pts or key in seen:
+            return
+        if max_sqrs is not None and len(pts) > max_sqrs:
+            return
+        seen.add(key)
+        totals.append((name, kind, total, pts))
+
+    for name, pts in get_regions(N):
+
+        region = set(pts)
+        region_total = combine(op, [line_total] * (len(pts) // N))
+        grp_of_pt = {pt: puzzle.get_group_idx(pt) for pt in pts}
+        grps = sorted(set(grp_of_pt.values()) - {-1})
+        is_fully_grouped = -1 not in grp_of_pt.values()
+
+        # Innies.
+        known = {
+                i for i in grps
+                if grp_totals[i] is not None and
+                   all(pt in region for pt in groups[i][1:])
+        }
+        innies = [pt for pt in pts if grp_of_pt[pt] not in known]
+        part = combine(op, [grp_totals[i] for i in known])
+        add_total(name, 'innies', uncombine(op, region_total, part), innies)
+
+        # Outies.
+        if is_fully_grouped and all(grp_totals[i] is not None for i in grps):
+            outies = [
+                    pt for i in grps for pt in groups[i][1:]
+                    if pt not in region
+            ]
+            whole = combine(op, [grp_totals[i] for i in grps])
+            total = uncombine(op, whole, region_total)
+            add_total(name, 'outies', total, outies)
+
+    return totals
+
+def narrow_to_total(masks, op, total):
+    """ Return a list of new masks, one for each mask in `masks`, keeping only
+        the values that could be part of a sum (or product) equal to `total`,
+        based on the least and greatest values of the other masks. A zero
+        mask means there's no way to reach `total`.
+    """
+
+    if not all(masks):
+        return list(masks)
+
+    lo = [(d & -d).bit_length() - 1 for d in masks]
+    hi = [d.bit_length() - 1 for d in masks]
+    lo_total, hi_total = combine(op, lo), combine(op, hi)
+
+    new_masks = []
+    for k, d in enumerate(masks):
+        if op == add:
+            lo_rest = lo_total - lo[k]
+            hi_rest = hi_total - hi[k]
+        else:
+            lo_rest = lo_total // lo[k]
+            hi_rest = hi_total // hi[k]
+        for v in range(lo[k], hi[k] + 1):
+            if not d & (1 << v):
+                continue
+            rest = uncombine(op, total, v)
+            if rest is None or not lo_rest <= rest <= hi_rest:
+                d &= ~(1 << v)
+        new_masks.append(d)
+    return new_masks